@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Measure memory used by request bodies when dispatching an event.
+
+Compares keeping the encoded payload as text, where every request will
+convert it to bytes when signing and posting, to sharing a single bytes
+buffer between all the requests for the event.
+
+The bodies of all requests are kept alive until the end, as they would be
+when the requests are in flight concurrently (e.g. using the Celery
+eventlet/gevent pools).
+
+Usage::
+
+    $ python t/benchmarks/body_memory.py [subscribers] [payload_size]
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import sys
+import tracemalloc
+
+from thorn.utils.compat import want_bytes
+from thorn.utils.hmac import sign
+from thorn.utils.json import dumps
+
+
+def deliver(body):
+    # Signing and posting the body both need bytes: the HMAC is computed
+    # over bytes, and http.client encodes text bodies before sending.
+    signature = sign('sha256', 'secret', body)
+    return signature, want_bytes(body)
+
+
+def dispatch(body, subscribers):
+    return [deliver(body) for _ in range(subscribers)]
+
+
+def measure(prepare, subscribers, payload_size):
+    payload = {'event': 'article.changed', 'data': {'body': 'x' * payload_size}}
+    tracemalloc.start()
+    try:
+        sent = dispatch(prepare(dumps(payload)), subscribers)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(sent) == subscribers
+    return peak
+
+
+def main(argv=sys.argv):
+    subscribers = int(argv[1]) if len(argv) > 1 else 100
+    payload_size = int(argv[2]) if len(argv) > 2 else 1024 * 1024
+    text = measure(lambda body: body, subscribers, payload_size)
+    shared = measure(want_bytes, subscribers, payload_size)
+    print('subscribers={0} payload={1}KiB'.format(
+        subscribers, payload_size // 1024))
+    print('  text body:   peak {0:>10.1f} KiB'.format(text / 1024.0))
+    print('  shared body: peak {0:>10.1f} KiB'.format(shared / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,7 +13,8 @@ from thorn import Thorn, Event, ModelEvent
 from thorn import _state
 
 DEFAULT_SIGNALS = {
-    signals.post_save, signals.post_delete, signals.m2m_changed,
+    signals.pre_save, signals.post_save, signals.post_init,
+    signals.post_delete, signals.m2m_changed,
 }
 
 DEFAULT_RECIPIENT_VALIDATORS = [
@@ -64,7 +65,9 @@ def test_cases_has_app(request, app, dispatcher, patching):
 @pytest.fixture()
 def signals(patching):
     signals = Mock(name='signals')
+    patching('django.db.models.signals.pre_save', signals.pre_save)
     patching('django.db.models.signals.post_save', signals.post_save)
+    patching('django.db.models.signals.post_init', signals.post_init)
     patching('django.db.models.signals.post_delete', signals.post_delete)
     patching('django.db.models.signals.m2m_changed', signals.m2m_changed)
     return signals
@@ -2,13 +2,17 @@ from __future__ import absolute_import, unicode_literals
 
 import pickle
 import pytest
+import threading
 
 from weakref import ref
 
 from case import Mock, call
 
+from thorn.conf import MIME_JSON
 from thorn.exceptions import BufferNotEmpty
 from thorn.dispatch.base import Dispatcher
+from thorn.request import Request
+from thorn.utils import json
 
 
 def subscriber_from_dict(d, event):
@@ -69,6 +73,45 @@ class test_Dispatcher:
         req.dispatch.assert_called()
         req2.dispatch.assert_called()
 
+    def test_buffer__local_to_thread(self):
+        self.dispatcher.enable_buffer()
+        req = Mock(name='req')
+        self.dispatcher.dispatch_request(req)
+        seen = []
+
+        def other_thread():
+            seen.append(self.dispatcher._buffer)
+            self.dispatcher.enable_buffer()
+            self.dispatcher.dispatch_request(Mock(name='req2'))
+            seen.append(list(self.dispatcher.pending_outbound))
+            self.dispatcher.flush_buffer()
+        t = threading.Thread(target=other_thread)
+        t.start()
+        t.join()
+        assert seen[0] is False
+        assert req not in seen[1]
+        assert list(self.dispatcher.pending_outbound) == [req]
+        req.dispatch.assert_not_called()
+
+    def test_buffer__local_to_context(self):
+        contextvars = pytest.importorskip('contextvars')
+        self.dispatcher.pending_outbound  # state created in parent context
+        ctx = contextvars.copy_context()
+
+        def in_task():
+            self.dispatcher.enable_buffer()
+            self.dispatcher.dispatch_request(Mock(name='req'))
+            return len(self.dispatcher.pending_outbound)
+        assert ctx.run(in_task) == 1
+        assert not self.dispatcher._buffer
+        assert not self.dispatcher.pending_outbound
+
+    def test_buffer__default_enabled(self):
+        dispatcher = Dispatcher(app=self._app, buffer=True)
+        assert dispatcher._buffer
+        dispatcher.disable_buffer()
+        assert not dispatcher._buffer
+
     def test_send(self, patching):
         barrier = patching('thorn.dispatch.base.barrier')
         event = Mock(name='event')
@@ -96,6 +139,8 @@ class test_Dispatcher:
         targets[0].content_type = 'A'
         targets[1].content_type = 'A'
         targets[2].content_type = 'B'
+        for target in targets:
+            target.projection = None
         codecB = Mock(name='codecB')
         self._app.settings.THORN_CODECS = {'B': codecB}
         list(self.dispatcher.prepare_requests(
@@ -120,6 +165,33 @@ class test_Dispatcher:
         assert self.dispatcher.encode_cached('a', cache1, 'A') == v1
         assert self.dispatcher.encode_cached('a', cache2, 'A') == encode()
 
+    def test_prepare_requests__projection(self):
+        self.dispatcher.subscribers_for_event = Mock(name='subscribers')
+        targets = self.dispatcher.subscribers_for_event.return_value = [
+            Mock(name='r1'), Mock(name='r2'), Mock(name='r3'),
+        ]
+        for target in targets:
+            target.content_type = 'A'
+        targets[0].projection = 'data.a, event'
+        targets[1].projection = ['event', 'data.a']
+        targets[2].projection = ''
+        encode = self.dispatcher.encode_payload = Mock(name='encode_payload')
+        encode.side_effect = lambda data, ctype: data
+        payload = {'event': 'foo.bar', 'data': {'a': 1, 'b': 2}}
+        list(self.dispatcher.prepare_requests('foo.bar', payload, None))
+        assert encode.call_count == 2
+        calls = [c[0][1] for c in self._app.Request.call_args_list]
+        assert calls[0] == {'event': 'foo.bar', 'data': {'a': 1}}
+        assert calls[1] is calls[0]
+        assert calls[2] is payload
+
+    def test_encode_cached__shares_bytes(self):
+        cache = {}
+        self._app.settings.THORN_CODECS = {'A': lambda data: 'x' * 1000}
+        body = self.dispatcher.encode_cached({}, cache, 'A')
+        assert isinstance(body, bytes)
+        assert self.dispatcher.encode_cached({}, cache, 'A') is body
+
     def test_encode_payload(self):
         data = Mock(name='data')
         codec = Mock(name='codec')
@@ -223,3 +295,94 @@ class test_Dispatcher:
         d2 = pickle.loads(pickle.dumps(self.dispatcher))
         assert d2.timeout == 303
         assert d2.app is self.app
+
+
+class test_Dispatcher_batching:
+
+    @pytest.fixture(autouse=True)
+    def setup_app(self, app):
+        self.app = app
+        self.dispatcher = Dispatcher(app=app)
+
+    def mock_subscriber(self, uuid, batch_size=None, content_type=MIME_JSON):
+        return Mock(name='subscriber', uuid=uuid, batch_size=batch_size,
+                    content_type=content_type, url='http://e.com/' + uuid)
+
+    def mock_req(self, event, subscriber, data=b'{"x": 1}', **kwargs):
+        return Request(event, data, None, subscriber, app=self.app, **kwargs)
+
+    def test_batch_requests(self):
+        a = self.mock_subscriber('A', batch_size=2)
+        b = self.mock_subscriber('B')
+        c = self.mock_subscriber('C', batch_size=10, content_type='x/y')
+        reqs = [
+            self.mock_req('x.a', a), self.mock_req('x.b', b),
+            self.mock_req('y.a', a), self.mock_req('z.a', a),
+            self.mock_req('x.c', c), self.mock_req('y.c', c),
+        ]
+        batched = list(self.dispatcher.batch_requests(reqs))
+        assert batched[:3] == [reqs[1], reqs[4], reqs[5]]
+        assert batched[3].subscriber is a
+        assert batched[3].batch == 2
+        assert batched[3].event == 'x.a,y.a'
+        assert batched[4] is reqs[3]
+        assert len(batched) == 5
+
+    def test_batch_requests__separate_routes(self):
+        a = self.mock_subscriber('A', batch_size=10)
+        reqs = [
+            self.mock_req('x.a', a, queue='high'), self.mock_req('y.a', a),
+        ]
+        assert list(self.dispatcher.batch_requests(reqs)) == reqs
+
+    def test_merge_requests(self):
+        a = self.mock_subscriber('A', batch_size=10)
+        reqs = [
+            self.mock_req('x.a', a, timeout=1.0, deadline=100.0),
+            self.mock_req('x.a', a, data='{"y": 2}', timeout=3.0,
+                          deadline=200.0),
+        ]
+        batch = self.dispatcher.merge_requests(reqs)
+        assert batch.event == 'x.a'
+        assert batch.timeout == 3.0
+        assert batch.deadline == 200.0
+        assert batch.headers['Hook-Batch'] == '2'
+        assert json.loads(batch.data) == [
+            {'event': 'x.a', 'delivery': reqs[0].id, 'data': {'x': 1}},
+            {'event': 'x.a', 'delivery': reqs[1].id, 'data': {'y': 2}},
+        ]
+
+    def test_merge_requests__outcome(self):
+        a = self.mock_subscriber('A', batch_size=10)
+        on_success, on_error = Mock(name='on_success'), Mock(name='on_error')
+        reqs = [
+            self.mock_req('x.a', a, on_success=on_success, on_error=on_error)
+            for _ in range(2)
+        ]
+        batch = self.dispatcher.merge_requests(reqs)
+        batch.response = Mock(name='response')
+        batch._p()
+        on_success.assert_has_calls([call(reqs[0]), call(reqs[1])])
+        assert reqs[0].response is batch.response
+
+        reqs = [
+            self.mock_req('x.a', a, on_success=on_success, on_error=on_error)
+            for _ in range(2)
+        ]
+        batch = self.dispatcher.merge_requests(reqs)
+        exc = KeyError()
+        batch._p.throw(exc, propagate=False)
+        on_error.assert_has_calls([call(reqs[0], exc), call(reqs[1], exc)])
+
+    def test_flush_buffer__batches(self):
+        a = self.mock_subscriber('A', batch_size=10)
+        reqs = [self.mock_req('x.a', a) for _ in range(3)]
+        self.dispatcher._dispatch_request = Mock(name='_dispatch_request')
+        self.dispatcher.enable_buffer()
+        for req in reqs:
+            self.dispatcher.dispatch_request(req)
+        self.dispatcher.flush_buffer()
+        self.dispatcher._dispatch_request.assert_called_once()
+        batch = self.dispatcher._dispatch_request.call_args[0][0]
+        assert batch.batch == 3
+        assert not self.dispatcher.pending_outbound
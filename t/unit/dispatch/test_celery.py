@@ -1,6 +1,6 @@
 from __future__ import absolute_import, unicode_literals
 
-from case import ANY, Mock, call, patch
+from case import Mock, call, patch
 
 from thorn.dispatch.celery import Dispatcher, WorkerDispatcher
 from thorn.request import Request
@@ -19,15 +19,46 @@ class test_Dispatcher:
         send_event.s.assert_called_once_with(
             event, payload, user.pk, 3.03, context, kw=9
         )
-        send_event.s().apply_async.assert_called_once_with()
+        send_event.s().apply_async.assert_called_once_with(expires=None)
         assert res is send_event.s().apply_async()
 
+    def test_send__routing(self, patching):
+        send_event = patching('thorn.dispatch.celery.send_event')
+        Dispatcher().send(
+            Mock(name='event'), {}, None, queue='hooks.high', priority=None)
+        send_event.s().apply_async.assert_called_once_with(
+            expires=None, queue='hooks.high')
+
+    def test_send__deadline(self, patching, app):
+        send_event = patching('thorn.dispatch.celery.send_event')
+        patching('time.time').return_value = 1000.0
+        Dispatcher(app=app).send(
+            Mock(name='event'), {}, None, deadline=1030.0)
+        send_event.s().apply_async.assert_called_once_with(expires=30.0)
+
+    def test_send__deadline_with_dead_letter_sink(self, patching, app):
+        send_event = patching('thorn.dispatch.celery.send_event')
+        app.dead_letter_sink = Mock(name='dead_letter_sink')
+        Dispatcher(app=app).send(
+            Mock(name='event'), {}, None, deadline=1030.0)
+        send_event.s().apply_async.assert_called_once_with(expires=None)
+
+    def test_batch_expires(self, patching, app):
+        patching('time.time').return_value = 1000.0
+        d = Dispatcher(app=app)
+        assert d.batch_expires([
+            Mock(deadline=1010.0), Mock(deadline=1030.0)]) == 30.0
+        assert d.batch_expires([
+            Mock(deadline=1010.0), Mock(deadline=None)]) is None
+        assert d.batch_expires([]) is None
+
     @patch('thorn.dispatch.celery.group')
     def test_flush_buffer(self, group, app):
         g = [None]
 
         subscriber = Mock(name='subscriber')
         subscriber.url = 'http://example.com/?e=1'
+        subscriber.as_dict.return_value = {'uuid': 'UUID'}
 
         def group_consume_generator(arg):
             g[0] = list(arg)
@@ -45,11 +76,29 @@ class test_Dispatcher:
         group.return_value.delay.assert_called_once_with()
         assert not d.pending_outbound
 
+    @patch('thorn.dispatch.celery.group')
+    def test_flush_buffer__empty(self, group):
+        Dispatcher().flush_buffer()
+        group.assert_not_called()
+
+    @patch('thorn.dispatch.celery.group')
+    def test_flush_buffer__not_owner(self, group):
+        class Owner(object):
+            pass
+        owner = Owner()
+        d = Dispatcher()
+        d.enable_buffer(owner=owner)
+        d.pending_outbound.append(Mock(name='request'))
+        d.flush_buffer(owner=Owner())
+        group.assert_not_called()
+        assert d.pending_outbound
+
 
 class test_WorkerDispatcher:
 
     def setup(self):
         self.app = Mock(name='app')
+        self.app.settings.THORN_FAIR_QUEUING = False
         self.dispatcher = WorkerDispatcher(app=self.app)
 
     def test_send(self, patching):
@@ -61,6 +110,11 @@ class test_WorkerDispatcher:
             return group.return_value
         group.side_effect = eval_genexp
         reqs = [Mock(name='r1'), Mock(name='r2'), Mock(name='r2')]
+        for i, req in enumerate(reqs):
+            req.routing = {}
+            req.as_dict.return_value = {
+                'id': i, 'data': None, 'subscriber': {'uuid': 'UUID'},
+            }
         self.dispatcher.prepare_requests = Mock(name='prepare_requests')
         self.dispatcher.prepare_requests.return_value = reqs
         self.dispatcher.group_requests = Mock(name='group_requests')
@@ -68,17 +122,113 @@ class test_WorkerDispatcher:
             [r] for r in reqs
         ]
         self.dispatcher.send(Mock(), Mock(), Mock(), Mock())
-        dispatch_requests.s.assert_has_calls([
-            call([req.as_dict()]) for req in reqs
-        ])
+        assert dispatch_requests.s.call_args_list == [
+            call({
+                'shared': {'id': i, 'data': None, 'subscriber': 'UUID'},
+                'requests': [{}],
+            }) for i, req in enumerate(reqs)
+        ]
 
-    def test_group_requests(self, patching):
-        chunks = patching('thorn.dispatch.celery.chunks')
+    def test_as_request_message__offloads_body_once(self):
+        claim_check = self.app.claim_check
+        claim_check.offload_body.side_effect = lambda body: {'ref': body}
+        offloaded = {}
         reqs = [Mock(name='r1'), Mock(name='r2'), Mock(name='r3')]
-        ret = self.dispatcher.group_requests(reqs)
-        chunks.assert_called_with(
-            ANY, self.app.settings.THORN_CHUNKSIZE)
-        assert ret is chunks()
+        for req in reqs:
+            req.subscriber.pk = None
+        reqs[0].as_dict.return_value = {'data': 'x' * 100}
+        reqs[1].as_dict.return_value = {'data': 'x' * 100}
+        reqs[2].as_dict.return_value = {'data': {'form': 1}}
+        messages = [
+            self.dispatcher.as_request_message(req, offloaded)
+            for req in reqs
+        ]
+        assert messages[0]['data'] == {'ref': 'x' * 100}
+        assert messages[1]['data'] is messages[0]['data']
+        assert messages[2]['data'] == {'form': 1}
+        claim_check.offload_body.assert_called_once_with('x' * 100)
+
+    def test_as_request_message__subscriber_ref(self):
+        req = Mock(name='req')
+        req.as_dict.side_effect = lambda: {
+            'data': None, 'subscriber': {'uuid': 'UUID', 'hmac_secret': 'x'},
+        }
+        req.subscriber.pk = 1
+        assert self.dispatcher.as_request_message(req, {}) == {
+            'data': None, 'subscriber': 'UUID',
+        }
+        req.subscriber.pk = None
+        assert self.dispatcher.as_request_message(req, {}) == {
+            'data': None, 'subscriber': {'uuid': 'UUID', 'hmac_secret': 'x'},
+        }
+
+    def test_prepare_body__keeps_text(self):
+        assert self.dispatcher.prepare_body('{"foo": 1}') == '{"foo": 1}'
+
+    def test_group_requests(self):
+        self.app.settings.THORN_CHUNKSIZE = 2
+        reqs = [Mock(name='r{0}'.format(i), routing={}) for i in range(5)]
+        assert list(self.dispatcher.group_requests(reqs)) == [
+            reqs[0:2], reqs[2:4], reqs[4:5],
+        ]
+
+    def test_group_requests__by_route(self):
+        self.app.settings.THORN_CHUNKSIZE = 10
+        high = {'queue': 'hooks.high', 'priority': 9}
+        reqs = [
+            Mock(name='r1', routing={}),
+            Mock(name='r2', routing=high),
+            Mock(name='r3', routing=high),
+            Mock(name='r4', routing={}),
+        ]
+        assert list(self.dispatcher.group_requests(reqs)) == [
+            reqs[0:1], reqs[1:3], reqs[3:4],
+        ]
+
+    def test_group_requests__fair_queuing(self):
+        self.app.settings.THORN_CHUNKSIZE = 2
+        self.app.settings.THORN_FAIR_QUEUING = True
+        self.app.settings.THORN_FAIR_QUEUING_WEIGHTS = {}
+        big = [self.mock_req('big{0}'.format(i), 1) for i in range(6)]
+        small = [self.mock_req('small', 2)]
+        shared = [self.mock_req('shared', None)]
+        assert list(self.dispatcher.group_requests(big + small + shared)) == [
+            big[0:2], small, shared, big[2:4], big[4:6],
+        ]
+
+    def test_group_requests__fair_queuing_weights(self):
+        self.app.settings.THORN_CHUNKSIZE = 1
+        self.app.settings.THORN_FAIR_QUEUING = True
+        self.app.settings.THORN_FAIR_QUEUING_WEIGHTS = {2: 2}
+        a = [self.mock_req('a{0}'.format(i), 1) for i in range(3)]
+        b = [self.mock_req('b{0}'.format(i), 2) for i in range(3)]
+        assert list(self.dispatcher.group_requests(a + b)) == [
+            [a[0]], [b[0]], [b[1]], [a[1]], [b[2]], [a[2]],
+        ]
+
+    def test_subscriber_owner(self):
+        subscriber = Mock(name='subscriber', user_id=3)
+        assert self.dispatcher.subscriber_owner(subscriber) == 3
+        subscriber = Mock(name='subscriber', spec=['user_ident'])
+        subscriber.user_ident.return_value = 4
+        assert self.dispatcher.subscriber_owner(subscriber) == 4
+
+    def mock_req(self, name, owner):
+        req = Mock(name=name, routing={})
+        req.subscriber.user_id = owner
+        return req
+
+    def test_as_request_group__routing(self, patching):
+        group = patching('thorn.dispatch.celery.group')
+        group.side_effect = list
+        self.app.settings.THORN_CHUNKSIZE = 10
+        dispatch_requests = patching('thorn.dispatch.celery.dispatch_requests')
+        req = Mock(name='req', routing={'queue': 'hooks.high'}, deadline=None)
+        req.as_dict.return_value = {'id': 1, 'data': None}
+        req.subscriber.pk = None
+        self.dispatcher.as_request_group([req])
+        dispatch_requests.s().set.assert_called_once_with(
+            expires=None, queue='hooks.high')
 
     def test_compare_requests(self):
         a = Mock(name='r1')
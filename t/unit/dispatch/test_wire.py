@@ -0,0 +1,80 @@
+from __future__ import absolute_import, unicode_literals
+
+from case import Mock, patch
+
+from thorn.dispatch.wire import (
+    SubscriberCache, compact_requests, expand_requests, is_compact,
+    is_subscriber_ref,
+)
+
+
+def test_compact_requests():
+    messages = [
+        {'id': 1, 'event': 'foo.bar', 'data': 'x', 'subscriber': 'A'},
+        {'id': 2, 'event': 'foo.bar', 'data': 'x', 'subscriber': 'B'},
+        {'id': 3, 'event': 'foo.bar', 'data': 'y', 'subscriber': 'C',
+         'extra': 1},
+    ]
+    batch = compact_requests(messages)
+    assert is_compact(batch)
+    assert batch['shared'] == {'event': 'foo.bar'}
+    assert batch['requests'][0] == {'id': 1, 'data': 'x', 'subscriber': 'A'}
+    assert expand_requests(batch) == messages
+
+
+def test_compact_requests__single():
+    messages = [{'id': 1, 'event': 'foo.bar'}]
+    assert expand_requests(compact_requests(messages)) == messages
+
+
+def test_is_compact():
+    assert not is_compact([{'id': 1}])
+    assert is_compact({'shared': {}, 'requests': []})
+
+
+def test_is_subscriber_ref():
+    assert is_subscriber_ref('5ef6e2f7-ab9c-4c8a-a543-0c5d6a9b3e8c')
+    assert not is_subscriber_ref({'url': 'http://example.com'})
+
+
+class test_SubscriberCache:
+
+    def setup(self):
+        self._app = Mock(name='app')
+        self.cache = SubscriberCache(timeout=10.0, app=self._app)
+        self.subscribers = [
+            Mock(name='s1', uuid='A'), Mock(name='s2', uuid='B'),
+        ]
+        self._app.Subscribers.with_uuids.return_value = self.subscribers
+
+    def test_timeout_from_settings(self):
+        self._app.settings.THORN_SUBSCRIBER_CACHE_TIMEOUT = 303.0
+        assert SubscriberCache(app=self._app).timeout == 303.0
+
+    def test_get_many(self):
+        assert self.cache.get_many(['A', 'B', 'C']) == {
+            'A': self.subscribers[0], 'B': self.subscribers[1],
+        }
+        self._app.Subscribers.with_uuids.assert_called_once_with(
+            {'A', 'B', 'C'})
+        assert self.cache.get('A') is self.subscribers[0]
+        self._app.Subscribers.with_uuids.assert_called_once_with(
+            {'A', 'B', 'C'})
+
+    def test_get__missing(self):
+        self._app.Subscribers.with_uuids.return_value = []
+        assert self.cache.get('C') is None
+
+    @patch('thorn.dispatch.wire.monotonic')
+    def test_expires(self, monotonic):
+        monotonic.return_value = 100.0
+        self.cache.get_many(['A'])
+        monotonic.return_value = 111.0
+        self.cache.get_many(['A'])
+        assert self._app.Subscribers.with_uuids.call_count == 2
+
+    def test_clear(self):
+        self.cache.get_many(['A'])
+        self.cache.clear()
+        self.cache.get_many(['A'])
+        assert self._app.Subscribers.with_uuids.call_count == 2
@@ -55,3 +55,10 @@ class test_SubscriberManager:
                 user=getattr(self, username) if username else None,
             )
         ]
+
+    def test_with_uuids(self):
+        wanted = self.subscribers[:2]
+        assert sorted(
+            r.url for r in Subscriber.objects.with_uuids(
+                str(s.uuid) for s in wanted)
+        ) == sorted(s.url for s in wanted)
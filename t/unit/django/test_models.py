@@ -35,6 +35,9 @@ class test_Subscriber:
             'hmac_secret': subscriber.hmac_secret,
             'hmac_digest': subscriber.hmac_digest,
             'uuid': str(subscriber.uuid),
+            'projection': subscriber.projection,
+            'rate_limit': subscriber.rate_limit,
+            'batch_size': subscriber.batch_size,
         }
 
     def test_from_dict__arg(self):
@@ -2,11 +2,12 @@ from __future__ import absolute_import, unicode_literals
 
 import pytest
 
-from case import Mock
+from case import ANY, Mock
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
 
 from thorn.django import signals
+from thorn.django.signals import PreviousVersionTracker
 from thorn.django.utils import serialize_model
 
 
@@ -75,45 +76,20 @@ class test_dispatch_on_change(SignalDispatcherCase):
         self.dispatch(self.instance, raw=True, created=True)
         self.fun.assert_not_called()
 
-    def test_on_pre_save(self):
-        self.dispatch.use_transitions = True
-        instance = Mock(Name='instance')
-        sender = Mock(name='sender')
-        self.dispatch.on_pre_save(instance, sender, raw=False)
-        sender.objects.get.assert_called_once_with(pk=instance.pk)
-        assert instance._previous_version is sender.objects.get()
-
-    def test_on_pre_save__ObjectDoesNotExist(self):
+    def test_connect__tracks_previous_version(self):
+        self.dispatch.tracker = Mock(name='tracker')
         self.dispatch.use_transitions = True
-        instance = Mock(Name='instance')
-        instance._previous_version = None
-        sender = Mock(name='sender')
-        sender.objects.get.side_effect = ObjectDoesNotExist()
-        self.dispatch.on_pre_save(instance, sender, raw=False)
-        sender.objects.get.assert_called_once_with(pk=instance.pk)
-        assert instance._previous_version is None
+        self.dispatch.tracked_fields = {'state'}
+        self.dispatch.snapshot = True
+        self.dispatch.connect(sender=self.Model)
+        self.dispatch.tracker.track.assert_called_once_with(
+            self.Model, fields={'state'}, snapshot=True)
 
-    def test_on_pre_save__disabled(self):
+    def test_connect__without_transitions(self):
+        self.dispatch.tracker = Mock(name='tracker')
         self.dispatch.use_transitions = False
-        instance = Mock(name='instance')
-        sender = Mock(name='sender')
-        self.dispatch.on_pre_save(instance, sender, raw=False)
-        sender.objects.get.assert_not_called()
-
-    def test_on_pre_save__disabled_on_raw(self):
-        self.dispatch.use_transitions = True
-        instance = Mock(Name='instance')
-        sender = Mock(name='sender')
-        self.dispatch.on_pre_save(instance, sender, raw=True)
-        sender.objects.get.assert_not_called()
-
-    def test_on_pre_save__disabled_on_object_creation(self):
-        self.dispatch.use_transitions = True
-        instance = Mock(Name='instance')
-        instance.pk = None
-        sender = Mock(name='sender')
-        self.dispatch.on_pre_save(instance, sender, raw=False)
-        sender.objects.get.assert_not_called()
+        self.dispatch.connect(sender=self.Model)
+        self.dispatch.tracker.track.assert_not_called()
 
     def test_connect(self):
         self.dispatch.connect(sender=self.Model)
@@ -122,6 +98,138 @@ class test_dispatch_on_change(SignalDispatcherCase):
         )
 
 
+class test_PreviousVersionTracker:
+
+    @pytest.fixture(autouse=True)
+    def setup_self(self, signals):
+        self.signals = signals
+        self.tracker = PreviousVersionTracker()
+        self.Model = Mock(name='Model')
+        self.fields = {
+            'state': Mock(name='state', concrete=True, is_relation=False),
+            'author': Mock(name='author', concrete=True, is_relation=True),
+            'tags': Mock(name='tags', concrete=False, is_relation=True),
+        }
+
+        def get_field(name):
+            try:
+                return self.fields[name]
+            except KeyError:
+                raise FieldDoesNotExist(name)
+        self.Model._meta.get_field.side_effect = get_field
+
+    def mock_instance(self, pk=1, adding=False, **values):
+        instance = Mock(name='instance', pk=pk)
+        instance._state.adding = adding
+        instance.__dict__.update(values)
+        return instance
+
+    def test_track(self):
+        self.tracker.track(self.Model, fields={'state'})
+        assert self.tracker.fields[self.Model] == {'state'}
+        assert not self.tracker.uses_snapshots(self.Model)
+        self.signals.pre_save.connect.assert_called_once_with(
+            self.tracker.on_pre_save, sender=self.Model, weak=False,
+            dispatch_uid=ANY,
+        )
+        self.signals.post_init.connect.assert_not_called()
+
+    def test_track__union(self):
+        self.tracker.track(self.Model, fields={'state'})
+        self.tracker.track(self.Model, fields={'author'})
+        assert self.tracker.fields[self.Model] == {'state', 'author'}
+        self.tracker.track(self.Model, fields=None)
+        assert self.tracker.fields[self.Model] is None
+        self.tracker.track(self.Model, fields={'state'})
+        assert self.tracker.fields[self.Model] is None
+
+    @pytest.mark.parametrize('fields', [None, set(), {'tags'}, {'missing'}])
+    def test_track__all_fields(self, fields):
+        self.tracker.track(self.Model, fields=fields, snapshot=True)
+        assert self.tracker.fields[self.Model] is None
+        assert not self.tracker.uses_snapshots(self.Model)
+
+    def test_track__snapshot(self):
+        self.tracker.track(self.Model, fields={'state'}, snapshot=True)
+        assert self.tracker.uses_snapshots(self.Model)
+        self.signals.post_init.connect.assert_called_once_with(
+            self.tracker.on_post_init, sender=self.Model, weak=False,
+            dispatch_uid=ANY,
+        )
+        self.signals.post_save.connect.assert_called_once_with(
+            self.tracker.on_post_save, sender=self.Model, weak=False,
+            dispatch_uid=ANY,
+        )
+
+    def test_track__snapshot_relation(self):
+        self.tracker.track(self.Model, fields={'author'}, snapshot=True)
+        assert not self.tracker.uses_snapshots(self.Model)
+
+    def test_track__snapshot_requires_all_events(self):
+        self.tracker.track(self.Model, fields={'state'}, snapshot=True)
+        self.tracker.track(self.Model, fields={'state'}, snapshot=False)
+        assert not self.tracker.uses_snapshots(self.Model)
+
+    def test_on_pre_save(self):
+        self.tracker.track(self.Model, fields={'state'})
+        instance = self.mock_instance()
+        self.tracker.on_pre_save(self.Model, instance, raw=False)
+        self.Model.objects.only.assert_called_once_with('state')
+        self.Model.objects.only().get.assert_called_once_with(pk=instance.pk)
+        assert instance._previous_version is self.Model.objects.only().get()
+
+    def test_on_pre_save__all_fields(self):
+        self.tracker.track(self.Model)
+        instance = self.mock_instance()
+        self.tracker.on_pre_save(self.Model, instance, raw=False)
+        self.Model.objects.only.assert_not_called()
+        self.Model.objects.get.assert_called_once_with(pk=instance.pk)
+        assert instance._previous_version is self.Model.objects.get()
+
+    def test_on_pre_save__ObjectDoesNotExist(self):
+        instance = self.mock_instance()
+        instance._previous_version = None
+        self.Model.objects.get.side_effect = ObjectDoesNotExist()
+        self.tracker.on_pre_save(self.Model, instance, raw=False)
+        assert instance._previous_version is None
+
+    def test_on_pre_save__raw(self):
+        self.tracker.on_pre_save(self.Model, self.mock_instance(), raw=True)
+        self.Model.objects.get.assert_not_called()
+
+    def test_on_pre_save__object_creation(self):
+        instance = self.mock_instance(pk=None)
+        self.tracker.on_pre_save(self.Model, instance, raw=False)
+        self.Model.objects.get.assert_not_called()
+
+    def test_snapshot(self):
+        self.tracker.track(self.Model, fields={'state'}, snapshot=True)
+        instance = self.mock_instance(state='NEW')
+        self.tracker.on_post_init(self.Model, instance)
+        instance.__dict__['state'] = 'PUBLISHED'
+        self.tracker.on_pre_save(self.Model, instance, raw=False)
+        self.Model.objects.get.assert_not_called()
+        self.Model.objects.only.assert_not_called()
+        assert instance._previous_version.state == 'NEW'
+
+        self.tracker.on_post_save(self.Model, instance, raw=False)
+        self.tracker.on_pre_save(self.Model, instance, raw=False)
+        assert instance._previous_version.state == 'PUBLISHED'
+
+    def test_snapshot__adding(self):
+        self.tracker.track(self.Model, fields={'state'}, snapshot=True)
+        instance = self.mock_instance(adding=True, state='NEW')
+        self.tracker.on_post_init(self.Model, instance)
+        assert self.tracker.from_snapshot(self.Model, instance) is None
+
+    def test_snapshot__deferred_field(self):
+        self.tracker.track(self.Model, fields={'state'}, snapshot=True)
+        instance = self.mock_instance()
+        self.tracker.on_post_init(self.Model, instance)
+        self.tracker.on_pre_save(self.Model, instance, raw=False)
+        self.Model.objects.only.assert_called_once_with('state')
+
+
 class test_dispatch_on_delete(SignalDispatcherCase):
     dispatcher = signals.dispatch_on_delete
 
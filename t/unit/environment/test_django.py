@@ -53,3 +53,16 @@ def test_signals(patching, env):
 def test_reverse(env, symbol_by_name):
     assert env.reverse is symbol_by_name.return_value
     symbol_by_name.assert_called_once_with(env.reverse_cls)
+
+
+def test_caches(env, symbol_by_name):
+    assert env.caches is symbol_by_name.return_value
+    symbol_by_name.assert_called_once_with(env.caches_cls)
+
+
+def test_get_model(env, symbol_by_name):
+    model = env.get_model('app.Model')
+    symbol_by_name.assert_called_once_with(env.apps_cls)
+    symbol_by_name.return_value.get_model.assert_called_once_with(
+        'app.Model')
+    assert model is symbol_by_name.return_value.get_model.return_value
@@ -0,0 +1,142 @@
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from case import Mock, patch
+
+from thorn.circuit import CircuitBreaker, MemoryCache
+from thorn.exceptions import CircuitOpen
+
+HOST = ('http', 80, 'example.com')
+OTHER_HOST = ('https', 443, 'example.org')
+
+
+class test_MemoryCache:
+
+    def test_get_set(self):
+        cache = MemoryCache()
+        assert cache.get('a') is None
+        assert cache.get('a', 1) == 1
+        cache.set('a', 2)
+        assert cache.get('a') == 2
+
+    def test_add(self):
+        cache = MemoryCache()
+        assert cache.add('a', 1)
+        assert not cache.add('a', 2)
+        assert cache.get('a') == 1
+
+    def test_incr(self):
+        cache = MemoryCache()
+        with pytest.raises(ValueError):
+            cache.incr('a')
+        cache.set('a', 1)
+        assert cache.incr('a') == 2
+        assert cache.get('a') == 2
+
+    def test_delete_many(self):
+        cache = MemoryCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.delete_many(['a', 'b', 'c'])
+        assert cache.get('a') is None
+        assert cache.get('b') is None
+
+    @patch('time.time')
+    def test_timeout(self, time):
+        time.return_value = 100.0
+        cache = MemoryCache()
+        cache.set('a', 1, timeout=10)
+        assert cache.get('a') == 1
+        time.return_value = 110.0
+        assert cache.get('a') is None
+        assert cache.add('a', 2)
+
+
+class test_CircuitBreaker:
+
+    @pytest.fixture(autouse=True)
+    def setup_time(self, patching):
+        self.time = patching('time.time')
+        self.time.return_value = 1000.0
+
+    @pytest.fixture()
+    def breaker(self, app):
+        return CircuitBreaker(
+            threshold=3, timeout=30.0, enabled=True, app=app)
+
+    def test_settings(self, app):
+        app.settings.THORN_CIRCUIT_BREAKER = True
+        app.settings.THORN_CIRCUIT_BREAKER_THRESHOLD = 10
+        app.settings.THORN_CIRCUIT_BREAKER_TIMEOUT = 60.0
+        app.settings.THORN_CIRCUIT_BREAKER_CACHE = None
+        breaker = CircuitBreaker(app=app)
+        assert breaker.enabled
+        assert breaker.threshold == 10
+        assert breaker.timeout == 60.0
+        assert isinstance(breaker.cache, MemoryCache)
+
+    def test_shared_cache(self, app):
+        app.env = Mock(name='env')
+        app.env.caches = {'shared': Mock(name='cache')}
+        breaker = CircuitBreaker(cache='shared', app=app)
+        assert breaker.cache is app.env.caches['shared']
+
+    def test_opens_after_threshold(self, breaker):
+        breaker.before_request(HOST)
+        breaker.on_failure(HOST)
+        breaker.on_failure(HOST)
+        assert breaker.state(HOST) == 'closed'
+        breaker.before_request(HOST)
+        breaker.on_failure(HOST)
+        assert breaker.state(HOST) == 'open'
+        with pytest.raises(CircuitOpen) as excinfo:
+            breaker.before_request(HOST)
+        assert excinfo.value.urlident == HOST
+        assert excinfo.value.retry_after == 30.0
+        breaker.before_request(OTHER_HOST)
+
+    def test_success_resets_failures(self, breaker):
+        breaker.on_failure(HOST)
+        breaker.on_failure(HOST)
+        breaker.on_success(HOST)
+        breaker.on_failure(HOST)
+        breaker.on_failure(HOST)
+        assert breaker.state(HOST) == 'closed'
+
+    def test_half_open__probe_succeeds(self, breaker):
+        for _ in range(3):
+            breaker.on_failure(HOST)
+        self.time.return_value = 1030.0
+        assert breaker.state(HOST) == 'half-open'
+        breaker.before_request(HOST)  # probe
+        with pytest.raises(CircuitOpen) as excinfo:
+            breaker.before_request(HOST)
+        assert excinfo.value.retry_after == 30.0
+        breaker.on_success(HOST)
+        assert breaker.state(HOST) == 'closed'
+        breaker.before_request(HOST)
+
+    def test_half_open__probe_fails(self, breaker):
+        for _ in range(3):
+            breaker.on_failure(HOST)
+        self.time.return_value = 1030.0
+        breaker.before_request(HOST)  # probe
+        breaker.on_failure(HOST)
+        assert breaker.state(HOST) == 'open'
+        with pytest.raises(CircuitOpen) as excinfo:
+            breaker.before_request(HOST)
+        assert excinfo.value.retry_after == 30.0
+
+    def test_half_open__probe_lost(self, breaker):
+        for _ in range(3):
+            breaker.on_failure(HOST)
+        self.time.return_value = 1030.0
+        breaker.before_request(HOST)  # probe never completes
+        self.time.return_value = 1060.0
+        breaker.before_request(HOST)  # new probe
+
+    def test_on_success__only_resets_failing_hosts(self, breaker):
+        breaker._cache = Mock(name='cache')
+        breaker.on_success(HOST)
+        breaker.cache.delete_many.assert_not_called()
@@ -23,6 +23,21 @@ def app():
     ('THORN_HMAC_SIGNER', 'default_hmac_signer'),
     ('THORN_SIGNAL_HONORS_TRANSACTION', 'default_signal_honors_transaction'),
     ('THORN_ALLOW_REDIRECTS', 'default_allow_redirects'),
+    ('THORN_PAYLOAD_STORE', 'default_payload_store'),
+    ('THORN_PAYLOAD_STORE_THRESHOLD', 'default_payload_store_threshold'),
+    ('THORN_SUBSCRIBER_CACHE_TIMEOUT', 'default_subscriber_cache_timeout'),
+    ('THORN_RETRY_BACKOFF', 'default_retry_backoff'),
+    ('THORN_RETRY_BACKOFF_MAX', 'default_retry_backoff_max'),
+    ('THORN_RETRY_JITTER', 'default_retry_jitter'),
+    ('THORN_RESPONSE_CLASSIFIER', 'default_response_classifier'),
+    ('THORN_CIRCUIT_BREAKER', 'default_circuit_breaker'),
+    ('THORN_CIRCUIT_BREAKER_THRESHOLD', 'default_circuit_breaker_threshold'),
+    ('THORN_CIRCUIT_BREAKER_TIMEOUT', 'default_circuit_breaker_timeout'),
+    ('THORN_CIRCUIT_BREAKER_CACHE', 'default_circuit_breaker_cache'),
+    ('THORN_DEBOUNCE_CACHE', 'default_debounce_cache'),
+    ('THORN_FAIR_QUEUING', 'default_fair_queuing'),
+    ('THORN_EVENT_TTL', 'default_event_ttl'),
+    ('THORN_DEAD_LETTER_SINK', 'default_dead_letter_sink'),
 ])
 def test_settings(setting, default_attr, app):
     s1 = Settings(app=app)
@@ -41,6 +56,27 @@ def test_THORN_SUBSCRIBERS(app):
     assert Settings(app=app).THORN_SUBSCRIBERS == 'just'
 
 
+def test_THORN_RATE_LIMITS(app):
+    app.config.THORN_RATE_LIMITS = None
+    assert Settings(app=app).THORN_RATE_LIMITS == {}
+    app.config.THORN_RATE_LIMITS = {'example.com': '10/s'}
+    assert Settings(app=app).THORN_RATE_LIMITS == {'example.com': '10/s'}
+
+
+def test_THORN_EVENT_ROUTES(app):
+    app.config.THORN_EVENT_ROUTES = None
+    assert Settings(app=app).THORN_EVENT_ROUTES == {}
+    app.config.THORN_EVENT_ROUTES = {'user.*': 'hooks.high'}
+    assert Settings(app=app).THORN_EVENT_ROUTES == {'user.*': 'hooks.high'}
+
+
+def test_THORN_FAIR_QUEUING_WEIGHTS(app):
+    app.config.THORN_FAIR_QUEUING_WEIGHTS = None
+    assert Settings(app=app).THORN_FAIR_QUEUING_WEIGHTS == {}
+    app.config.THORN_FAIR_QUEUING_WEIGHTS = {1: 3}
+    assert Settings(app=app).THORN_FAIR_QUEUING_WEIGHTS == {1: 3}
+
+
 def test_THORN_SUBSCRIBER_MODEL(app):
     app.config.THORN_SUBSCRIBER_MODEL = None
     assert Settings(app=app).THORN_SUBSCRIBER_MODEL is None
@@ -5,6 +5,7 @@ import pytest
 from case import ANY, Mock
 
 from thorn.decorators import webhook_model
+from thorn.django.signals import PreviousVersionTracker
 from thorn.events import ModelEvent
 
 from testapp import models
@@ -99,6 +100,45 @@ class test_functional_webhook_model:
             context={'instance': jerry_pk},
         )
 
+    # the save is an UPDATE in a transaction (BEGIN), and the snapshot
+    # replaces the SELECT of the previous version.
+    @pytest.mark.parametrize('snapshot,queries', [(False, 3), (True, 2)])
+    def test_on_change__transition(self, snapshot, queries,
+                                   patching, django_assert_num_queries):
+        patching('thorn.django.signals.dispatch_on_change.tracker',
+                 PreviousVersionTracker())
+        on_jerry = ModelEvent(
+            'x.jerry', username__now_eq='jerry', snapshot=snapshot,
+        ).dispatches_on_change()
+        on_jerry.send = Mock(name='event.send')
+        webhook_model(on_jerry=on_jerry)(self.Model)
+        obj = self.Model.objects.get(pk=self.obj.pk)
+        obj.username = 'jerry'
+        with django_assert_num_queries(queries):
+            obj.save()
+        on_jerry.send.assert_called_once()
+        on_jerry.send.reset_mock()
+        obj.save()
+        on_jerry.send.assert_not_called()
+
+    def test_on_change__grouped(self, patching, django_assert_num_queries):
+        on_jerry = ModelEvent('x.jerry', username__eq='jerry')
+        on_kramer = ModelEvent('x.kramer', username__eq='kramer')
+        webhook_model(
+            on_change=ModelEvent('x.change'),
+            on_jerry=on_jerry.dispatches_on_change(),
+            on_kramer=on_kramer.dispatches_on_change(),
+        )(self.Model)
+        send_many = patching.object(
+            on_jerry.dispatcher, 'send_many', wraps=on_jerry.dispatcher.send_many)
+        self.obj.username = 'jerry'
+        # the UPDATE, and one query for the subscribers of both events.
+        with django_assert_num_queries(3):
+            self.obj.save()
+        send_many.assert_called_once_with([
+            ('x.change', ANY, None, ANY), ('x.jerry', ANY, None, ANY),
+        ])
+
     def test_on_change__does_not_dispatch_on_create(self):
         on_create = ModelEvent('x.create')
         on_change = ModelEvent('x.change')
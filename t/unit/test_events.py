@@ -57,6 +57,8 @@ class test_Event:
             on_success=on_success, on_error=on_error,
             timeout=3.34, on_timeout=on_timeout,
             retry=None, retry_delay=None, retry_max=None,
+            retry_backoff=None, retry_backoff_max=None, retry_jitter=None,
+            deadline=None,
             recipient_validators=None, headers=None,
             context=None, extra_subscribers=None, allow_keepalive=True,
         )
@@ -70,6 +72,8 @@ class test_Event:
             on_success=None, on_error=None,
             timeout=None, on_timeout=None,
             retry=None, retry_delay=None, retry_max=None,
+            retry_backoff=None, retry_backoff_max=None, retry_jitter=None,
+            deadline=None,
             recipient_validators=None, headers=None,
             context=None, extra_subscribers=None, allow_keepalive=True,
         )
@@ -82,10 +86,59 @@ class test_Event:
             on_success=None, on_error=None,
             timeout=None, on_timeout=None,
             retry=None, retry_delay=None, retry_max=None,
+            retry_backoff=None, retry_backoff_max=None, retry_jitter=None,
+            deadline=None,
             recipient_validators=None, headers=None,
             context=None, extra_subscribers=None, allow_keepalive=False,
         )
 
+    def test_send__routing(self, dispatcher, app):
+        event = mock_event('x.y', dispatcher, app,
+                           queue='hooks.high', priority=9)
+        event.send({'foo': 'bar'})
+        assert dispatcher.send.call_args[1]['queue'] == 'hooks.high'
+        assert dispatcher.send.call_args[1]['priority'] == 9
+
+    def test_routing(self, dispatcher, app):
+        app.settings.THORN_EVENT_ROUTES = {
+            'user.created': {'queue': 'hooks.users', 'priority': 3},
+            'user.*': 'hooks.user',
+            '*.deleted': {'priority': 0},
+            '*': {'queue': 'hooks'},
+        }
+        event = mock_event('x.y', dispatcher, app)
+        assert event.routing('user.created') == {
+            'queue': 'hooks.users', 'priority': 3}
+        assert event.routing('user.changed') == {'queue': 'hooks.user'}
+        assert event.routing('order.deleted') == {'priority': 0}
+        assert event.routing('order.created') == {'queue': 'hooks'}
+        assert event.routing() == {'queue': 'hooks'}
+        event.priority = 9
+        assert event.routing('user.created') == {
+            'queue': 'hooks.users', 'priority': 9}
+        event.queue = 'hooks.high'
+        assert event.routing('order.created') == {
+            'queue': 'hooks.high', 'priority': 9}
+
+    def test_routing__no_routes(self, dispatcher, app):
+        app.settings.THORN_EVENT_ROUTES = {}
+        assert mock_event('x.y', dispatcher, app).routing() == {}
+
+    def test_deadline(self, dispatcher, app):
+        event = mock_event('x.y', dispatcher, app, ttl=60.0)
+        assert event.deadline(now=1000.0) == 1060.0
+        event.ttl = None
+        app.settings.THORN_EVENT_TTL = None
+        assert event.deadline(now=1000.0) is None
+        app.settings.THORN_EVENT_TTL = 30.0
+        assert event.deadline(now=1000.0) == 1030.0
+
+    def test_send__with_ttl(self, dispatcher, app, patching):
+        patching('time.time').return_value = 1000.0
+        event = mock_event('x.y', dispatcher, app, ttl=60.0)
+        event.send({'foo': 'bar'})
+        assert dispatcher.send.call_args[1]['deadline'] == 1060.0
+
     def test_dispatcher(self):
         event = Event('george.costanza', app=Mock(name='app'))
         assert event.dispatcher is event.app.dispatcher
@@ -165,6 +218,8 @@ class test_ModelEvent:
             on_success=None, on_error=None,
             timeout=None, on_timeout=None,
             retry=None, retry_delay=None, retry_max=None,
+            retry_backoff=None, retry_backoff_max=None, retry_jitter=None,
+            deadline=None,
             recipient_validators=None, headers=None,
             context=None, extra_subscribers=None, allow_keepalive=True,
         )
@@ -211,6 +266,8 @@ class test_ModelEvent:
             on_success=None, on_error=None,
             timeout=None, on_timeout=None,
             retry=None, retry_delay=None, retry_max=None,
+            retry_backoff=None, retry_backoff_max=None, retry_jitter=None,
+            deadline=None,
             recipient_validators=None, headers=None,
             context=None, extra_subscribers=None, allow_keepalive=True,
         )
@@ -282,6 +339,30 @@ class test_ModelEvent:
         assert (event.instance_data(instance) is
                 instance.webhooks.payload.return_value)
 
+    def test_instance_data__delta(self):
+        event = self.mock_event('x.y', delta=True)
+        instance = Mock(name='instance', pk=3, title='B', state='NEW')
+        instance._meta.concrete_fields = [
+            Mock(attname='id'), Mock(attname='title'), Mock(attname='state'),
+        ]
+        instance.id = 3
+        instance._previous_version = Mock(id=3, title='A', state='NEW')
+        assert event.instance_data(instance) == {
+            'pk': 3, 'changed': {'title': 'B'},
+        }
+
+    def test_instance_data__delta_without_previous_version(self):
+        event = self.mock_event('x.y', delta=True)
+        instance = self.Model()
+        instance._previous_version = None
+        assert (event.instance_data(instance) is
+                instance.webhooks.payload.return_value)
+
+    def test_delta__requires_previous_version(self):
+        event = self.mock_event('x.y', delta=True).dispatches_on_change()
+        assert not event.use_transitions
+        assert event.signal_dispatcher.use_transitions
+
     def test_instance_sender__field_undefined(self, event):
         assert not event.instance_sender(self.Model())
 
@@ -354,6 +435,49 @@ class test_ModelEvent:
             context={},
         )
 
+    def test_on_signal__debounce(self):
+        instance = self.Model()
+        event = self.mock_event(
+            'x.y', debounce=5.0, signal_honors_transaction=False)
+        event.send_debounced = Mock(name='send_debounced')
+        event.send_from_instance = Mock(name='send_from_instance')
+        event.on_signal(instance)
+        event.send_debounced.assert_called_once_with(instance)
+        event.send_from_instance.assert_not_called()
+
+    def test_send_debounced(self, patching):
+        send_debounced = patching('thorn.tasks.send_debounced')
+        event = self.mock_event('x.{0.pk}', debounce=5.0)
+        event.debounce_cache = Mock(name='debounce_cache')
+        event.debounce_cache.add.return_value = True
+        instance = self.Model()
+        instance.pk = 303
+        instance._meta.label = 'app.Model'
+        type(instance).webhooks = Mock(name='webhooks')
+        type(instance).webhooks.events = {'on_change': event}
+        result = event.send_debounced(instance)
+        key = 'thorn.debounce.app.Model.303.x.303'
+        assert event.debounce_key(instance) == key
+        event.debounce_cache.add.assert_called_once_with(key, 1, 65.0)
+        send_debounced.apply_async.assert_called_once_with(
+            ('app.Model', 303, 'on_change', key), countdown=5.0,
+        )
+        assert result is send_debounced.apply_async.return_value
+
+    def test_send_debounced__already_scheduled(self, patching):
+        send_debounced = patching('thorn.tasks.send_debounced')
+        event = self.mock_event('x.y', debounce=5.0)
+        event.debounce_cache = Mock(name='debounce_cache')
+        event.debounce_cache.add.return_value = False
+        assert event.send_debounced(self.Model()) is None
+        send_debounced.apply_async.assert_not_called()
+
+    def test_debounce_cache(self):
+        event = self.mock_event('x.y', debounce=5.0, app=Mock(name='app'))
+        event.app.settings.THORN_DEBOUNCE_CACHE = 'hooks'
+        event.app.caches = {'hooks': Mock(name='cache')}
+        assert event.debounce_cache is event.app.caches['hooks']
+
     def test_on_signal__raises_propagate(self):
         instance = self.Model()
         event = self.mock_event('x.y', propagate_errors=True)
@@ -0,0 +1,74 @@
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from case import Mock
+
+from thorn.ratelimit import RateLimiter
+
+
+def mock_subscriber(url='http://example.com/hook', rate_limit=None, uuid='A'):
+    return Mock(name='subscriber', url=url, rate_limit=rate_limit, uuid=uuid)
+
+
+class test_RateLimiter:
+
+    @pytest.fixture(autouse=True)
+    def setup_time(self, patching):
+        self.monotonic = patching('kombu.utils.limits.monotonic')
+        self.monotonic.return_value = 100.0
+
+    def test_limits_from_settings(self, app):
+        app.settings.THORN_RATE_LIMITS = {'example.com': '10/s'}
+        assert RateLimiter(app=app).limits == {'example.com': '10/s'}
+
+    def test_no_limits(self, app):
+        limiter = RateLimiter(limits={}, app=app)
+        for _ in range(100):
+            assert limiter.acquire(mock_subscriber()) == 0
+        assert not limiter._buckets
+
+    def test_host_limit(self, app):
+        limiter = RateLimiter(limits={'example.com': '2/s'}, app=app)
+        assert limiter.acquire(mock_subscriber(uuid='A')) == 0
+        assert limiter.acquire(mock_subscriber(uuid='B')) == 0
+        assert limiter.acquire(mock_subscriber(uuid='C')) == 0.5
+        assert limiter.acquire(
+            mock_subscriber(url='http://example.org/hook')) == 0
+        self.monotonic.return_value = 100.5
+        assert limiter.acquire(mock_subscriber(uuid='C')) == 0
+
+    def test_subscriber_limit(self, app):
+        limiter = RateLimiter(limits={}, app=app)
+        subscriber = mock_subscriber(rate_limit='60/m')
+        assert limiter.acquire(subscriber) == 0
+        assert limiter.acquire(subscriber) == 1.0
+        assert limiter.acquire(mock_subscriber(uuid='B')) == 0
+
+    def test_host_and_subscriber_limit(self, app):
+        limiter = RateLimiter(limits={'example.com': '1/s'}, app=app)
+        subscriber = mock_subscriber(rate_limit='1/m')
+        assert limiter.acquire(subscriber) == 0
+        assert limiter.acquire(subscriber) == 60.0
+        self.monotonic.return_value = 101.0
+        # host bucket refilled, but not the subscriber bucket:
+        # no tokens are taken from the host bucket.
+        assert limiter.acquire(subscriber) == 59.0
+        assert limiter.acquire(mock_subscriber(uuid='B')) == 0
+
+    def test_changed_rate_uses_new_bucket(self, app):
+        limiter = RateLimiter(limits={}, app=app)
+        assert limiter.acquire(mock_subscriber(rate_limit='1/m')) == 0
+        assert limiter.acquire(mock_subscriber(rate_limit='1/m')) == 60.0
+        assert limiter.acquire(mock_subscriber(rate_limit='2/m')) == 0
+
+    def test_subscriber_without_rate_limit_attribute(self, app):
+        subscriber = Mock(name='subscriber', spec=['url', 'uuid'])
+        subscriber.url = 'http://example.com'
+        assert RateLimiter(limits={}, app=app).acquire(subscriber) == 0
+
+    def test_clear(self, app):
+        limiter = RateLimiter(limits={}, app=app)
+        limiter.acquire(mock_subscriber(rate_limit='1/m'))
+        limiter.clear()
+        assert limiter.acquire(mock_subscriber(rate_limit='1/m')) == 0
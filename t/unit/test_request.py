@@ -3,11 +3,17 @@ from __future__ import absolute_import, unicode_literals
 import pickle
 import pytest
 
-from case import Mock, skip
+from case import Mock, patch, skip
 
 from thorn.conf import MIME_JSON
-from thorn.exceptions import SecurityError
-from thorn.request import Request, parse_url
+from thorn.exceptions import (
+    CircuitOpen, RequestExpired, ResponseError, RetryableResponseError,
+    SecurityError,
+)
+from thorn.request import (
+    Request, classify_response, dead_letter, expires_in,
+    parse_retry_after, parse_url, retry_countdown,
+)
 
 from conftest import DEFAULT_RECIPIENT_VALIDATORS
 
@@ -70,6 +76,7 @@ class test_Request:
 
     def test_dispatch(self):
         session = Mock(name='session')
+        session.post.return_value.status_code = 200
         host, url = self.req.to_safeurl(self.req.subscriber.url)
         expected_headers = self.expected_headers(self.req, host=host)
         self.req.dispatch(session=session)
@@ -98,6 +105,7 @@ class test_Request:
         self.req.allow_keepalive = False
         session = Mock(name='session')
         self.req.Session = Mock(name='req.Session')
+        self.req.Session.return_value.post.return_value.status_code = 200
         host, url = self.req.to_safeurl(self.req.subscriber.url)
         expected_headers = self.expected_headers(self.req, host=host)
         self.req.dispatch(session=session)
@@ -127,6 +135,122 @@ class test_Request:
         req.dispatch(session=session, propagate=False)
         req.handle_connection_error.assert_called_with(exc, propagate=False)
 
+    def test_dispatch__retryable_response(self):
+        session = Mock(name='session')
+        session.post.return_value.status_code = 503
+        session.post.return_value.headers = {'Retry-After': '120'}
+        req = mock_req(
+            self.event.name, 'http://e.com:80/hook',
+            on_error=None, on_timeout=None,
+        )
+        with pytest.raises(RetryableResponseError) as excinfo:
+            req.dispatch(session=session, propagate=True)
+        assert excinfo.value.retry_after == 120.0
+        assert excinfo.value.response is session.post()
+
+    def test_dispatch__permanent_response_error(self):
+        session = Mock(name='session')
+        session.post.return_value.status_code = 404
+        on_error = Mock(name='on_error')
+        req = mock_req(
+            self.event.name, 'http://e.com:80/hook', on_error=on_error,
+        )
+        req.dispatch(session=session, propagate=True)
+        exc = on_error.call_args[0][1]
+        assert isinstance(exc, ResponseError)
+        assert not isinstance(exc, RetryableResponseError)
+        req.on_success.assert_not_called()
+
+    def test_dispatch__permanent_response_error__not_propagated(self):
+        session = Mock(name='session')
+        session.post.return_value.status_code = 400
+        req = mock_req(
+            self.event.name, 'http://e.com:80/hook',
+            on_error=None, on_timeout=None,
+        )
+        req.dispatch(session=session, propagate=True)
+        assert req.response is session.post()
+
+    def test_response_classifier__custom(self):
+        classify = Mock(name='classify', return_value='success')
+        req = mock_req(self.event.name, 'http://e.com/hook')
+        req.response_classifier = classify
+        response = Mock(name='response')
+        req.check_response(response)
+        classify.assert_called_once_with(response)
+
+    def test_dispatch__circuit_breaker(self):
+        breaker = self.req.app.circuit_breaker = Mock(name='circuit_breaker')
+        session = Mock(name='session')
+        session.post.return_value.status_code = 200
+        self.req.dispatch(session=session)
+        breaker.before_request.assert_called_once_with(self.req.urlident)
+        breaker.on_success.assert_called_once_with(self.req.urlident)
+        breaker.on_failure.assert_not_called()
+
+    def test_dispatch__circuit_breaker__failure(self):
+        breaker = self.req.app.circuit_breaker = Mock(name='circuit_breaker')
+        session = Mock(name='session')
+        session.post.return_value.status_code = 503
+        session.post.return_value.headers = {}
+        self.req.dispatch(session=session)
+        breaker.on_failure.assert_called_once_with(self.req.urlident)
+        breaker.on_success.assert_not_called()
+
+    def test_dispatch__circuit_breaker__rejected(self):
+        breaker = self.req.app.circuit_breaker = Mock(name='circuit_breaker')
+        session = Mock(name='session')
+        session.post.return_value.status_code = 400
+        self.req.dispatch(session=session)
+        breaker.on_success.assert_called_once_with(self.req.urlident)
+        breaker.on_failure.assert_not_called()
+
+    def test_dispatch__circuit_open(self):
+        breaker = self.req.app.circuit_breaker = Mock(name='circuit_breaker')
+        exc = CircuitOpen(self.req.urlident, retry_after=10.0)
+        breaker.before_request.side_effect = exc
+        session = Mock(name='session')
+        self.req.dispatch(session=session)
+        session.post.assert_not_called()
+        self.req.on_error.assert_called_once_with(self.req, exc)
+        req = mock_req(
+            self.event.name, 'http://e.com:80/hook',
+            on_error=None, on_timeout=None,
+        )
+        with pytest.raises(CircuitOpen):
+            req.dispatch(session=session, propagate=True)
+
+    def test_dispatch__expired(self, app):
+        session = Mock(name='session')
+        sink = app.dead_letter_sink = Mock(name='dead_letter_sink')
+        req = mock_req(self.event.name, 'http://e.com/hook', deadline=1.0)
+        assert req.expired
+        req.dispatch(session=session)
+        session.post.assert_not_called()
+        sink.assert_called_once_with(req.as_dict())
+        assert isinstance(req.on_error.call_args[0][1], RequestExpired)
+
+    def test_headers__batch(self):
+        req = mock_req(self.event.name, 'http://e.com/hook')
+        assert 'Hook-Batch' not in req.headers
+        req = mock_req(self.event.name, 'http://e.com/hook', batch=3)
+        assert req.headers['Hook-Batch'] == '3'
+
+    def test_routing(self):
+        req = mock_req(self.event.name, 'http://e.com/hook')
+        assert req.routing == {}
+        req = mock_req(self.event.name, 'http://e.com/hook',
+                       queue='hooks.high', priority=0)
+        assert req.routing == {'queue': 'hooks.high', 'priority': 0}
+
+    def test_expires_before(self):
+        req = mock_req(self.event.name, 'http://e.com/hook', deadline=1030.0)
+        assert not req.expires_before(10.0, now=1000.0)
+        assert req.expires_before(30.0, now=1000.0)
+        req.deadline = None
+        assert not req.expires_before(1e9)
+        assert not req.expired
+
     def test_dispatch__illegal_port(self):
         session = Mock(name='session')
         req = mock_req(
@@ -175,6 +299,16 @@ class test_Request:
             self.req.on_error = None
             self.req.handle_connection_error(exc)
 
+    def test_retry_countdown(self):
+        req = mock_req(
+            self.event.name, 'http://e.com/hook',
+            retry_delay=10.0, retry_backoff=True,
+            retry_backoff_max=60.0, retry_jitter=False,
+        )
+        assert [req.retry_countdown(i) for i in range(4)] == [
+            10.0, 20.0, 40.0, 60.0,
+        ]
+
     def test_as_dict(self):
         assert self.req.as_dict() == {
             'id': self.req.id,
@@ -186,6 +320,13 @@ class test_Request:
             'retry': self.req.retry,
             'retry_delay': self.req.retry_delay,
             'retry_max': self.req.retry_max,
+            'retry_backoff': self.req.retry_backoff,
+            'retry_backoff_max': self.req.retry_backoff_max,
+            'retry_jitter': self.req.retry_jitter,
+            'deadline': self.req.deadline,
+            'queue': self.req.queue,
+            'priority': self.req.priority,
+            'batch': self.req.batch,
             'recipient_validators': DEFAULT_RECIPIENT_VALIDATORS,
             'allow_keepalive': self.req.allow_keepalive,
             'on_success': self.req.on_success,
@@ -223,3 +364,89 @@ class test_Request:
     @skip.if_python3()
     def test_repr__bytes_on_py2(self):
         assert isinstance(repr(self.req), bytes)
+
+
+class test_retry_countdown:
+
+    def test_fixed(self):
+        assert retry_countdown(3, 60.0) == 60.0
+
+    def test_backoff(self):
+        assert retry_countdown(0, 60.0, backoff=True, jitter=False) == 60.0
+        assert retry_countdown(3, 60.0, backoff=True, jitter=False) == 480.0
+
+    def test_backoff__factor(self):
+        assert retry_countdown(2, 60.0, backoff=2, jitter=False) == 8
+
+    def test_backoff__max(self):
+        assert retry_countdown(
+            10, 1.0, backoff=True, backoff_max=100.0, jitter=False) == 100.0
+
+    @patch('random.uniform')
+    def test_backoff__jitter(self, uniform):
+        uniform.return_value = 3.3
+        assert retry_countdown(2, 10.0, backoff=True) == 3.3
+        uniform.assert_called_once_with(0, 40.0)
+
+
+class test_classify_response:
+
+    @pytest.mark.parametrize('status,expected', [
+        (200, 'success'),
+        (204, 'success'),
+        (301, 'success'),
+        (400, 'fail'),
+        (404, 'fail'),
+        (410, 'fail'),
+        (408, 'retry'),
+        (429, 'retry'),
+        (500, 'retry'),
+        (501, 'fail'),
+        (502, 'retry'),
+        (503, 'retry'),
+        (504, 'retry'),
+    ])
+    def test_classify(self, status, expected):
+        assert classify_response(Mock(status_code=status)) == expected
+
+
+class test_parse_retry_after:
+
+    @pytest.mark.parametrize('value,expected', [
+        (None, None),
+        ('', None),
+        ('120', 120.0),
+        ('1.5', 1.5),
+        ('-3', 0.0),
+        ('not a date', None),
+        ('Wed, 21 Oct 2015 07:28:00 GMT', 60.0),
+        ('Wed, 21 Oct 2015 07:26:00 GMT', 0.0),
+    ])
+    def test_parse(self, value, expected):
+        assert parse_retry_after(value, now=1445412420.0) == expected
+
+
+class test_expires_in:
+
+    def test_no_deadline(self, app):
+        assert expires_in(None, app=app) is None
+
+    def test_deadline(self, app):
+        assert expires_in(1030.0, app=app, now=1000.0) == 30.0
+        assert expires_in(990.0, app=app, now=1000.0) == 0.0
+
+    def test_dead_letter_sink(self, app):
+        app.dead_letter_sink = Mock(name='dead_letter_sink')
+        assert expires_in(1030.0, app=app, now=1000.0) is None
+
+
+class test_dead_letter:
+
+    def test_no_sink(self, app):
+        app.settings.THORN_DEAD_LETTER_SINK = None
+        dead_letter({'id': 1}, app=app)
+
+    def test_sink(self, app):
+        app.settings.THORN_DEAD_LETTER_SINK = Mock(name='sink')
+        dead_letter({'id': 1}, app=app)
+        app.settings.THORN_DEAD_LETTER_SINK.assert_called_once_with({'id': 1})
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from case import Mock
+
+from thorn.storage import (
+    REF_KEY, BlobStore, ClaimCheck, FileSystemStore, MemoryStore, is_ref,
+)
+
+
+class test_BlobStore:
+
+    @pytest.mark.parametrize('method,args', [
+        ('put', ('key', 'value')),
+        ('get', ('key',)),
+        ('delete', ('key',)),
+    ])
+    def test_interface(self, method, args):
+        with pytest.raises(NotImplementedError):
+            getattr(BlobStore(), method)(*args)
+
+
+class test_MemoryStore:
+
+    def test_put_get_delete(self):
+        store = MemoryStore()
+        store.put('a', 'value')
+        assert store.get('a') == 'value'
+        store.delete('a')
+        store.delete('a')
+        with pytest.raises(KeyError):
+            store.get('a')
+
+
+class test_FileSystemStore:
+
+    @pytest.fixture()
+    def store(self, tmpdir):
+        return FileSystemStore(str(tmpdir.join('blobs')))
+
+    def test_put_get_delete(self, store):
+        store.put('a', '{"x": "€"}')
+        assert store.get('a') == '{"x": "€"}'
+        store.delete('a')
+        store.delete('a')
+        with pytest.raises(IOError):
+            store.get('a')
+
+    def test_key_cannot_escape_path(self, store, tmpdir):
+        store.put('../a', 'value')
+        assert store.get('a') == 'value'
+        assert not tmpdir.join('a').check()
+
+    def test_cleanup(self, store):
+        store.put('a', 'value')
+        store.cleanup(60.0)
+        assert store.get('a') == 'value'
+        store.cleanup(60.0, now=float('inf'))
+        with pytest.raises(IOError):
+            store.get('a')
+
+
+class test_ClaimCheck:
+
+    @pytest.fixture()
+    def claim_check(self, app):
+        return ClaimCheck(store='memory', threshold=10, app=app)
+
+    def test_disabled(self, app):
+        app.settings.THORN_PAYLOAD_STORE = None
+        claim_check = ClaimCheck(app=app)
+        payload = {'x': 'y' * 1000}
+        assert claim_check.offload_payload(payload) is payload
+        assert claim_check.offload_body('y' * 1000) == 'y' * 1000
+
+    def test_store_from_settings(self, app):
+        app.settings.THORN_PAYLOAD_STORE = 'memory'
+        app.settings.THORN_PAYLOAD_STORE_THRESHOLD = 303
+        claim_check = ClaimCheck(app=app)
+        assert isinstance(claim_check.store, MemoryStore)
+        assert claim_check.threshold == 303
+
+    def test_store_instance(self, app):
+        store = MemoryStore()
+        assert ClaimCheck(store=store, app=app).store is store
+
+    def test_offload_payload(self, claim_check):
+        assert claim_check.offload_payload({'x': 1}) == {'x': 1}
+        payload = {'x': 'y' * 100}
+        ref = claim_check.offload_payload(payload)
+        assert is_ref(ref)
+        assert ref['json']
+        assert claim_check.resolve(ref) == payload
+
+    def test_offload_body(self, claim_check):
+        assert claim_check.offload_body('short') == 'short'
+        assert claim_check.offload_body({'x': 'y' * 100}) == {'x': 'y' * 100}
+        ref = claim_check.offload_body('y' * 100)
+        assert is_ref(ref)
+        assert claim_check.resolve(ref) == 'y' * 100
+
+    def test_resolve__not_ref(self, claim_check):
+        assert claim_check.resolve('value') == 'value'
+        assert claim_check.resolve({'x': 1}) == {'x': 1}
+
+    def test_resolve__fetches_once(self, claim_check):
+        claim_check.store = Mock(name='store')
+        claim_check.store.get.return_value = 'value'
+        ref = {REF_KEY: 'key'}
+        assert claim_check.resolve(ref) == 'value'
+        assert claim_check.resolve(ref) == 'value'
+        claim_check.store.get.assert_called_once_with('key')
@@ -5,9 +5,12 @@ import pytest
 from django.contrib.auth import get_user_model
 
 from thorn.django.models import Subscriber
+from thorn.exceptions import RateLimited, RetryableResponseError
 from thorn.request import Request
+from thorn.utils.compat import want_bytes
 from thorn.tasks import (
-    send_event, dispatch_requests, dispatch_request, _worker_dispatcher,
+    send_event, send_debounced, dispatch_requests, dispatch_request,
+    _shared_body, _worker_dispatcher,
 )
 
 from case import Mock, call, patch
@@ -31,13 +34,53 @@ def task_retry(patching):
 
 
 def test_sends_event(worker_dispatcher, event):
+    claim_check = worker_dispatcher.return_value.app.claim_check
+    claim_check.resolve.side_effect = lambda payload: payload
     send_event(event.name, 'foobar', 501, 3.03, {'instance': 9})
+    claim_check.resolve.assert_called_once_with('foobar')
     worker_dispatcher.return_value.send.assert_called_with(
         event.name, 'foobar', 501,
         timeout=3.03, context={'instance': 9},
     )
 
 
+class test_send_debounced:
+
+    def setup(self):
+        self.app = Mock(name='app')
+        self.model = self.app.get_model.return_value
+        self.model.DoesNotExist = KeyError
+        self.event = Mock(name='event', use_transitions=False)
+        self.model.webhooks.events = {'on_change': self.event}
+
+    def test_send(self):
+        send_debounced('app.Model', 303, 'on_change', 'KEY', app=self.app)
+        self.app.get_model.assert_called_once_with('app.Model')
+        self.event.debounce_cache.delete.assert_called_once_with('KEY')
+        self.model._default_manager.get.assert_called_once_with(pk=303)
+        instance = self.model._default_manager.get.return_value
+        self.event.should_dispatch.assert_called_once_with(instance)
+        self.event.send_from_instance.assert_called_once_with(instance)
+
+    def test_no_longer_matching(self):
+        self.event.should_dispatch.return_value = False
+        send_debounced('app.Model', 303, 'on_change', 'KEY', app=self.app)
+        self.event.send_from_instance.assert_not_called()
+
+    def test_transitions(self):
+        self.event.use_transitions = True
+        send_debounced('app.Model', 303, 'on_change', 'KEY', app=self.app)
+        self.event.should_dispatch.assert_not_called()
+        self.event.send_from_instance.assert_called_once_with(
+            self.model._default_manager.get.return_value)
+
+    def test_instance_deleted(self):
+        self.model._default_manager.get.side_effect = KeyError()
+        send_debounced('app.Model', 303, 'on_change', 'KEY', app=self.app)
+        self.event.debounce_cache.delete.assert_called_once_with('KEY')
+        self.event.send_from_instance.assert_not_called()
+
+
 def test_dispatch(mock_dispatch_request, dispatcher, app):
     Session = app.Request.Session = Mock(name='Request.Session')
     subscriber = Subscriber(url='http://example.com')
@@ -52,9 +95,143 @@ def test_dispatch(mock_dispatch_request, dispatcher, app):
     dispatch_requests([req.as_dict() for req in reqs])
     Session.assert_called_once_with()
     mock_dispatch_request.assert_has_calls([
-        call(session=Session(), app=app, **req.as_dict())
+        call(session=Session(), app=app, bodies={}, **req.as_dict())
         for req in reqs
     ])
+    bodies = [c[1]['bodies'] for c in mock_dispatch_request.call_args_list]
+    assert bodies[1] is bodies[0]
+
+
+def test_dispatch__compact(mock_dispatch_request, app):
+    Session = app.Request.Session = Mock(name='Request.Session')
+    app.subscriber_cache = Mock(name='subscriber_cache')
+    stored = Mock(name='stored_subscriber')
+    app.subscriber_cache.get_many.return_value = {'A': stored}
+    dispatch_requests({
+        'shared': {'event': 'foo.created', 'data': 'a'},
+        'requests': [
+            {'id': 1, 'subscriber': 'A'},
+            {'id': 2, 'subscriber': 'B'},
+            {'id': 3, 'subscriber': {'url': 'http://example.com'}},
+        ],
+    })
+    app.subscriber_cache.get_many.assert_called_once_with({'A', 'B'})
+    mock_dispatch_request.assert_has_calls([
+        call(session=Session(), app=app, bodies={},
+             event='foo.created', data='a', id=1, subscriber=stored),
+        call(session=Session(), app=app, bodies={},
+             event='foo.created', data='a', id=3,
+             subscriber={'url': 'http://example.com'}),
+    ])
+    assert mock_dispatch_request.call_count == 2
+
+
+class test_dispatch__retry:
+
+    @pytest.fixture(autouse=True)
+    def setup_app(self, app, patching):
+        app.Request.Session = Mock(name='Request.Session')
+        self.dispatch_request = patching('thorn.tasks.dispatch_request')
+        self.apply_async = self.dispatch_request.apply_async
+        self.exc = app.Request.connection_errors[0]('failed')
+        self.dispatch_request.side_effect = [None, self.exc, None]
+        self.reqs = [
+            {'id': i, 'event': 'foo.created', 'data': 'a',
+             'subscriber': {'url': 'http://example.com/{0}'.format(i)},
+             'retry_delay': 10.0, 'retry_max': 3,
+             'retry_backoff': True, 'retry_backoff_max': 60.0,
+             'retry_jitter': False}
+            for i in range(3)
+        ]
+
+    def test_only_failed_request_is_retried(self):
+        dispatch_requests(self.reqs)
+        assert self.dispatch_request.call_count == 3
+        self.apply_async.assert_called_once_with(
+            kwargs=self.reqs[1], countdown=10.0, retries=1, expires=None,
+        )
+
+    def test_retry_after(self, app):
+        response = Mock(name='response', status_code=429)
+        self.dispatch_request.side_effect = [
+            None, RetryableResponseError(response, retry_after=300.0), None,
+        ]
+        dispatch_requests(self.reqs)
+        self.apply_async.assert_called_once_with(
+            kwargs=self.reqs[1], countdown=300.0, retries=1, expires=None,
+        )
+
+    def test_permanent_error_is_not_retried(self):
+        self.dispatch_request.side_effect = [None, None, None]
+        dispatch_requests(self.reqs)
+        self.apply_async.assert_not_called()
+
+    def test_rate_limited(self):
+        self.dispatch_request.side_effect = [
+            None, RateLimited(2.5), None,
+        ]
+        dispatch_requests(self.reqs)
+        assert self.dispatch_request.call_count == 3
+        self.apply_async.assert_called_once_with(
+            kwargs=self.reqs[1], countdown=2.5, retries=0, expires=None,
+        )
+
+    def test_deadline(self, patching):
+        patching('time.time').return_value = 1000.0
+        for req in self.reqs:
+            req['deadline'] = 1030.0
+        dispatch_requests(self.reqs)
+        self.apply_async.assert_called_once_with(
+            kwargs=self.reqs[1], countdown=10.0, retries=1, expires=30.0,
+        )
+
+    def test_retry__keeps_routing(self):
+        for req in self.reqs:
+            req.update(queue='hooks.high', priority=9)
+        dispatch_requests(self.reqs)
+        self.apply_async.assert_called_once_with(
+            kwargs=self.reqs[1], countdown=10.0, retries=1, expires=None,
+            queue='hooks.high', priority=9,
+        )
+
+    def test_deadline__expires_before_retry(self, app, patching):
+        patching('time.time').return_value = 1000.0
+        app.dead_letter_sink = Mock(name='dead_letter_sink')
+        for req in self.reqs:
+            req['deadline'] = 1005.0
+        dispatch_requests(self.reqs)
+        self.apply_async.assert_not_called()
+        app.dead_letter_sink.assert_called_once_with(self.reqs[1])
+
+    def test_retry_max_zero(self):
+        self.reqs[1]['retry_max'] = 0
+        dispatch_requests(self.reqs)
+        assert self.dispatch_request.call_count == 3
+        self.apply_async.assert_not_called()
+
+    def test_compact(self):
+        dispatch_requests({
+            'shared': {'event': 'foo.created', 'data': 'a',
+                       'retry_delay': 5.0, 'retry_backoff': False},
+            'requests': [
+                {'id': i, 'subscriber': {'url': 'http://example.com'}}
+                for i in range(3)
+            ],
+        })
+        self.apply_async.assert_called_once_with(
+            kwargs={'event': 'foo.created', 'data': 'a', 'id': 1,
+                    'retry_delay': 5.0, 'retry_backoff': False,
+                    'subscriber': {'url': 'http://example.com'}},
+            countdown=5.0, retries=1, expires=None,
+        )
+
+
+def test_shared_body():
+    bodies = {}
+    body = _shared_body('x' * 100, bodies)
+    assert body == b'x' * 100
+    assert _shared_body('x' * 100, bodies) is body
+    assert _shared_body({'form': 1}, bodies) == {'form': 1}
 
 
 @pytest.mark.django_db()
@@ -84,7 +261,12 @@ class test_dispatch_request:
 
     @pytest.fixture()
     def app_or_default(self, patching):
-        return patching('thorn.tasks.app_or_default')
+        app_or_default = patching('thorn.tasks.app_or_default')
+        app_or_default().claim_check.resolve.side_effect = lambda data: data
+        app_or_default().rate_limiter.acquire.return_value = 0
+        app_or_default().Request.return_value.expires_before.return_value = (
+            False)
+        return app_or_default
 
     def test_success(self, app_or_default):
         _Request = app_or_default().Request
@@ -93,10 +275,15 @@ class test_dispatch_request:
         subscriber_dict.pop('user', None)
         app_or_default().Subscriber.assert_called_once_with(**subscriber_dict)
         _Request.assert_called_once_with(
-            self.req.event, self.req.data,
+            self.req.event, want_bytes(self.req.data),
             self.req.sender, app_or_default().Subscriber(),
             id=self.req.id, timeout=self.req.timeout, retry=self.req.retry,
             retry_max=self.req.retry_max, retry_delay=self.req.retry_delay,
+            retry_backoff=self.req.retry_backoff,
+            retry_backoff_max=self.req.retry_backoff_max,
+            retry_jitter=self.req.retry_jitter, deadline=self.req.deadline,
+            queue=self.req.queue, priority=self.req.priority,
+            batch=self.req.batch,
             recipient_validators=DEFAULT_RECIPIENT_VALIDATORS,
             allow_keepalive=True, on_error=None, on_success=None,
             on_timeout=None
@@ -112,10 +299,15 @@ class test_dispatch_request:
         subscriber_dict.pop('user', None)
         app_or_default().Subscriber.assert_called_once_with(**subscriber_dict)
         _Request.assert_called_once_with(
-            self.req.event, self.req.data,
+            self.req.event, want_bytes(self.req.data),
             self.req.sender, app_or_default().Subscriber(),
             id=self.req.id, timeout=self.req.timeout, retry=self.req.retry,
             retry_max=self.req.retry_max, retry_delay=self.req.retry_delay,
+            retry_backoff=self.req.retry_backoff,
+            retry_backoff_max=self.req.retry_backoff_max,
+            retry_jitter=self.req.retry_jitter, deadline=self.req.deadline,
+            queue=self.req.queue, priority=self.req.priority,
+            batch=self.req.batch,
             recipient_validators=DEFAULT_RECIPIENT_VALIDATORS,
             allow_keepalive=False, on_error=None, on_success=None,
             on_timeout=None
@@ -130,10 +322,15 @@ class test_dispatch_request:
         subscriber_dict.pop('user', None)
         app_or_default().Subscriber.assert_called_once_with(**subscriber_dict)
         _Request.assert_called_once_with(
-            self.req2.event, self.req2.data,
+            self.req2.event, want_bytes(self.req2.data),
             self.req2.sender, app_or_default().Subscriber(),
             id=self.req2.id, timeout=self.req2.timeout, retry=self.req2.retry,
             retry_max=self.req2.retry_max, retry_delay=self.req2.retry_delay,
+            retry_backoff=self.req2.retry_backoff,
+            retry_backoff_max=self.req2.retry_backoff_max,
+            retry_jitter=self.req2.retry_jitter, deadline=self.req2.deadline,
+            queue=self.req2.queue, priority=self.req2.priority,
+            batch=self.req2.batch,
             recipient_validators=DEFAULT_RECIPIENT_VALIDATORS,
             allow_keepalive=True, on_error=None, on_success=None,
             on_timeout=None
@@ -141,24 +338,106 @@ class test_dispatch_request:
         _Request().dispatch.assert_called_once_with(
             session=self.session, propagate=_Request().retry)
 
+    def test_subscriber_ref(self, app_or_default):
+        _Request = app_or_default().Request
+        cache = app_or_default().subscriber_cache
+        dispatch_request(session=self.session, **dict(
+            self.req.as_dict(), subscriber='UUID'))
+        cache.get.assert_called_once_with('UUID')
+        assert _Request.call_args[0][3] is cache.get()
+        app_or_default().Subscriber.assert_not_called()
+
+    def test_subscriber_ref__missing(self, app_or_default):
+        app_or_default().subscriber_cache.get.return_value = None
+        dispatch_request(session=self.session, **dict(
+            self.req.as_dict(), subscriber='UUID'))
+        app_or_default().Request.assert_not_called()
+
+    def test_subscriber_instance(self, app_or_default):
+        _Request = app_or_default().Request
+        dispatch_request(session=self.session, **dict(
+            self.req.as_dict(), subscriber=self.subscriber))
+        assert _Request.call_args[0][3] is self.subscriber
+        app_or_default().Subscriber.assert_not_called()
+
     def test_connection_error(self, task_retry, app_or_default):
         _Request = app_or_default().Request
         _Request.return_value.connection_errors = (ValueError,)
         _Request.return_value.timeout_errors = ()
+        _Request.return_value.retryable_response_errors = ()
+        _Request.return_value.circuit_errors = ()
         exc = _Request.return_value.dispatch.side_effect = ValueError(10)
         task_retry.side_effect = exc
         with pytest.raises(ValueError):
             dispatch_request(session=self.session, **self.req.as_dict())
         task_retry.assert_called_with(
             exc=exc, max_retries=_Request().retry_max,
-            countdown=_Request().retry_delay,
+            countdown=_Request().retry_countdown.return_value,
+            expires=None,
         )
+        _Request().retry_countdown.assert_called_with(0)
+
+    def test_retryable_response(self, task_retry, app_or_default):
+        _Request = app_or_default().Request
+        _Request.return_value.connection_errors = ()
+        _Request.return_value.timeout_errors = ()
+        _Request.return_value.retryable_response_errors = (
+            RetryableResponseError,)
+        _Request.return_value.circuit_errors = ()
+        exc = _Request.return_value.dispatch.side_effect = (
+            RetryableResponseError(Mock(status_code=503), retry_after=30.0))
+        task_retry.side_effect = exc
+        with pytest.raises(RetryableResponseError):
+            dispatch_request(session=self.session, **self.req.as_dict())
+        task_retry.assert_called_with(
+            exc=exc, max_retries=_Request().retry_max, countdown=30.0,
+            expires=None,
+        )
+        _Request().retry_countdown.assert_not_called()
+
+    def test_rate_limited(self, app_or_default):
+        app_or_default().rate_limiter.acquire.return_value = 3.3
+        with pytest.raises(RateLimited) as excinfo:
+            dispatch_request(session=self.session, **self.req.as_dict())
+        assert excinfo.value.retry_after == 3.3
+        app_or_default().rate_limiter.acquire.assert_called_once_with(
+            app_or_default().Subscriber())
+        app_or_default().Request.assert_not_called()
+
+    def test_rate_limited__task(self, app_or_default, patching):
+        apply_async = patching('thorn.tasks.dispatch_request.apply_async')
+        app_or_default().rate_limiter.acquire.return_value = 3.3
+        message = self.req.as_dict()
+        dispatch_request.push_request(
+            called_directly=False, kwargs=message, retries=2)
+        try:
+            dispatch_request.run(**message)
+        finally:
+            dispatch_request.pop_request()
+        apply_async.assert_called_once_with(
+            kwargs=message, countdown=3.3, retries=2, expires=None)
+        app_or_default().Request.assert_not_called()
+
+    def test_connection_error__expires_before_retry(
+            self, task_retry, app_or_default):
+        _Request = app_or_default().Request
+        _Request.return_value.connection_errors = (ValueError,)
+        _Request.return_value.timeout_errors = ()
+        _Request.return_value.retryable_response_errors = ()
+        _Request.return_value.circuit_errors = ()
+        _Request.return_value.expires_before.return_value = True
+        _Request.return_value.dispatch.side_effect = ValueError(10)
+        dispatch_request(session=self.session, **self.req.as_dict())
+        task_retry.assert_not_called()
+        _Request().handle_expired.assert_called_once_with()
 
     def test_connection_error__retry_disabled(
             self, task_retry, app_or_default):
         _Request = app_or_default().Request
         _Request.return_value.connection_errors = (ValueError,)
         _Request.return_value.timeout_errors = ()
+        _Request.return_value.retryable_response_errors = ()
+        _Request.return_value.circuit_errors = ()
         _Request.return_value.retry = False
         exc = _Request.return_value.dispatch.side_effect = ValueError(11)
         task_retry.side_effect = exc
@@ -4,7 +4,9 @@ import pytest
 
 from case import Mock, patch
 
-from thorn.utils.functional import Q, chunks, traverse_subscribers
+from thorn.utils.functional import (
+    Q, chunks, interleave, parse_projection, project, traverse_subscribers,
+)
 
 
 @pytest.mark.parametrize('max,input,expected', [
@@ -15,6 +17,16 @@ def test_chunks(max, input, expected):
     assert list(chunks(iter(input), max)) == expected
 
 
+@pytest.mark.parametrize('iterables,weights,expected', [
+    ([[1, 2, 3], 'ab', 'x'], None, [1, 'a', 'x', 2, 'b', 3]),
+    ([[1, 2, 3, 4], 'ab', 'x'], [2, 1, 1], [1, 2, 'a', 'x', 3, 4, 'b']),
+    ([[1, 2], 'ab'], [0, 1], [1, 'a', 2, 'b']),
+    ([], None, []),
+])
+def test_interleave(iterables, weights, expected):
+    assert list(interleave(iterables, weights)) == expected
+
+
 class test_Q:
 
     def test_missing_op(self):
@@ -181,6 +193,15 @@ class test_Q:
         assert q3(x)
         assert not q4(x)
 
+    def test_transition_fields(self):
+        from django.db.models import Q as DjangoQ
+        q = Q(
+            DjangoQ(author__name__now_eq='x') | DjangoQ(title__eq='y'),
+            state__now_eq='PUBLISHED', state__ne='NEW', count__now_gt=3,
+        )
+        assert q.transition_fields() == {'author', 'state', 'count'}
+        assert Q(state__eq='NEW').transition_fields() == set()
+
     def test_now_eq__no_previous_version(self):
         class X(object):
             foo = 1
@@ -336,3 +357,29 @@ class test_traverse_subscribers:
 
     def test_none_items(self):
         assert list(traverse_subscribers([None, [None], None])) == []
+
+
+class test_parse_projection:
+
+    @pytest.mark.parametrize('value,expected', [
+        (None, None),
+        ('', None),
+        ([], None),
+        ('data.b, event', ('data.b', 'event')),
+        ('event data.b\nevent', ('data.b', 'event')),
+        (['event', 'data.b'], ('data.b', 'event')),
+    ])
+    def test_parse(self, value, expected):
+        assert parse_projection(value) == expected
+
+
+class test_project:
+
+    def test_project(self):
+        data = {'event': 'x', 'ref': 'y', 'data': {'a': 1, 'b': {'c': 2}}}
+        assert project(data, ['event', 'data.b.c', 'data.x', 'ref.z']) == {
+            'event': 'x', 'data': {'b': {'c': 2}},
+        }
+
+    def test_not_a_mapping(self):
+        assert project([1, 2, 3], ['a']) == {}
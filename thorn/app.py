@@ -22,6 +22,10 @@ class Thorn(object):
     model_event_cls = 'thorn.events:ModelEvent'
     settings_cls = 'thorn.conf:Settings'
     request_cls = 'thorn.request:Request'
+    claim_check_cls = 'thorn.storage:ClaimCheck'
+    subscriber_cache_cls = 'thorn.dispatch.wire:SubscriberCache'
+    circuit_breaker_cls = 'thorn.circuit:CircuitBreaker'
+    rate_limiter_cls = 'thorn.ratelimit:RateLimiter'
 
     dispatchers = {  # type: Mapping[str, str]
         'default': 'thorn.dispatch.base:Dispatcher',
@@ -112,6 +116,12 @@ class Thorn(object):
         # type: () -> Callable
         return symbol_by_name(self.settings.THORN_HMAC_SIGNER)
 
+    @cached_property
+    def dead_letter_sink(self):
+        # type: () -> Optional[Callable]
+        sink = self.settings.THORN_DEAD_LETTER_SINK
+        return symbol_by_name(sink) if sink is not None else None
+
     @property
     def config(self):
         # type: () -> Any
@@ -137,6 +147,15 @@ class Thorn(object):
         # type: () -> Any
         return self.env.signals
 
+    @property
+    def caches(self):
+        # type: () -> Any
+        return self.env.caches
+
+    def get_model(self, label):
+        # type: (str) -> type
+        return self.env.get_model(label)
+
     @property
     def reverse(self):
         # type: () -> Callable
@@ -182,6 +201,26 @@ class Thorn(object):
         # type: () -> type
         return self.subclass_with_self(self.request_cls)
 
+    @cached_property
+    def ClaimCheck(self):
+        # type: () -> type
+        return self.subclass_with_self(self.claim_check_cls)
+
+    @cached_property
+    def claim_check(self):
+        # type: () -> ClaimCheck
+        return self.ClaimCheck()
+
+    @cached_property
+    def SubscriberCache(self):
+        # type: () -> type
+        return self.subclass_with_self(self.subscriber_cache_cls)
+
+    @cached_property
+    def subscriber_cache(self):
+        # type: () -> SubscriberCache
+        return self.SubscriberCache()
+
     def subclass_with_self(self, Class,
                            name=None, attribute='app',
                            reverse=None, keep_reduce=False, **kw):
@@ -217,3 +256,23 @@ class Thorn(object):
             attrs['__reduce__'] = __reduce__
 
         return type(bytes_if_py2(name or Class.__name__), (Class,), attrs)
+
+    @cached_property
+    def CircuitBreaker(self):
+        # type: () -> type
+        return self.subclass_with_self(self.circuit_breaker_cls)
+
+    @cached_property
+    def circuit_breaker(self):
+        # type: () -> CircuitBreaker
+        return self.CircuitBreaker()
+
+    @cached_property
+    def RateLimiter(self):
+        # type: () -> type
+        return self.subclass_with_self(self.rate_limiter_cls)
+
+    @cached_property
+    def rate_limiter(self):
+        # type: () -> RateLimiter
+        return self.RateLimiter()
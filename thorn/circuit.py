@@ -0,0 +1,222 @@
+"""Per-host circuit breaker.
+
+When a subscriber host is down every request to it would still have to wait
+for the full timeout before failing.  The circuit breaker keeps track
+of failing hosts (by
+:attr:`Request.urlident <thorn.request.Request.urlident>`), so that
+requests to them can fail (or be retried later) immediately:
+
+- **closed**: requests are sent as usual, consecutive failures are counted.
+- **open**: after :setting:`THORN_CIRCUIT_BREAKER_THRESHOLD` failures
+  requests are not sent for :setting:`THORN_CIRCUIT_BREAKER_TIMEOUT` seconds,
+  instead raising :exc:`~thorn.exceptions.CircuitOpen`.
+- **half-open**: after the timeout a single probe request is let through,
+  closing the circuit if it succeeds, or opening it again if it fails.
+
+The state is kept in process memory by default, but can be shared by all
+web servers and workers using a Django cache
+(:setting:`THORN_CIRCUIT_BREAKER_CACHE`).
+"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+from six import string_types
+
+from celery.utils.functional import LRUCache
+
+from ._state import app_or_default
+from .exceptions import CircuitOpen
+
+__all__ = ['CircuitBreaker', 'MemoryCache']
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class MemoryCache(object):
+    """Minimal in-memory cache having the same API as Django caches.
+
+    Only the methods used by :class:`CircuitBreaker` are implemented.
+    """
+
+    def __init__(self, limit=1000):
+        # type: (int) -> None
+        self.data = LRUCache(limit=limit)
+        self.mutex = threading.Lock()
+
+    def get(self, key, default=None):
+        # type: (str, Any) -> Any
+        with self.mutex:
+            return self._get(key, default)
+
+    def set(self, key, value, timeout=None):
+        # type: (str, Any, float) -> None
+        with self.mutex:
+            self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        # type: (str, Any, float) -> bool
+        with self.mutex:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def incr(self, key, delta=1):
+        # type: (str, int) -> int
+        with self.mutex:
+            try:
+                expires, value = self.data[key]
+            except KeyError:
+                raise ValueError('Key {0!r} not found'.format(key))
+            value += delta
+            self.data[key] = (expires, value)
+            return value
+
+    def delete_many(self, keys):
+        # type: (Sequence[str]) -> None
+        with self.mutex:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def _get(self, key, default=None):
+        try:
+            expires, value = self.data[key]
+        except KeyError:
+            return default
+        if expires is not None and expires <= time.time():
+            self.data.pop(key, None)
+            return default
+        return value
+
+    def _set(self, key, value, timeout=None):
+        self.data[key] = (
+            time.time() + timeout if timeout is not None else None, value)
+
+
+class CircuitBreaker(object):
+    """Circuit breaker tracking the hosts of webhook subscribers.
+
+    Keyword Arguments:
+        threshold (int): Number of consecutive failures before
+            the circuit for a host is opened.
+        timeout (float): Number of seconds a circuit stays open before
+            letting a probe request through.
+        cache (Union[str, Any]): Django cache (or the alias of one)
+            used to share the state between processes.  Default is to keep
+            the state in memory.
+        enabled (bool): Enable/disable the circuit breaker.
+    """
+
+    app = None
+
+    #: Prefix used for cache keys.
+    key_prefix = 'thorn.circuit'
+
+    def __init__(self, threshold=None, timeout=None, cache=None,
+                 enabled=None, app=None):
+        # type: (int, float, Union[str, Any], bool, App) -> None
+        self.app = app_or_default(app or self.app)
+        settings = self.app.settings
+        self.enabled = (
+            enabled if enabled is not None
+            else settings.THORN_CIRCUIT_BREAKER)
+        self.threshold = (
+            threshold if threshold is not None
+            else settings.THORN_CIRCUIT_BREAKER_THRESHOLD)
+        self.timeout = (
+            timeout if timeout is not None
+            else settings.THORN_CIRCUIT_BREAKER_TIMEOUT)
+        self._cache = (
+            cache if cache is not None
+            else settings.THORN_CIRCUIT_BREAKER_CACHE)
+        # hosts this process has seen failing, so that we only need
+        # to reset the (possibly shared) state for these on success.
+        self._failing = set()
+
+    def before_request(self, urlident):
+        # type: (Tuple[str, int, str]) -> None
+        """Check that a request can be sent to host.
+
+        Raises:
+            ~thorn.exceptions.CircuitOpen: if the circuit is open,
+                or half-open with another probe request in progress.
+        """
+        opened_until = self.cache.get(self._key(urlident, 'open'))
+        if opened_until is None:
+            return  # closed
+        self._failing.add(urlident)
+        now = time.time()
+        if now < opened_until:
+            raise CircuitOpen(urlident, retry_after=opened_until - now)
+        # half-open: only one probe at a time, the probe will
+        # be considered failed if not done within the timeout.
+        if not self.cache.add(
+                self._key(urlident, 'probe'), now, self.timeout):
+            raise CircuitOpen(urlident, retry_after=self.timeout)
+
+    def on_success(self, urlident):
+        # type: (Tuple[str, int, str]) -> None
+        """Close circuit after a successful request to host."""
+        if urlident in self._failing:
+            self._failing.discard(urlident)
+            self.cache.delete_many([
+                self._key(urlident, 'failures'),
+                self._key(urlident, 'open'),
+                self._key(urlident, 'probe'),
+            ])
+
+    def on_failure(self, urlident):
+        # type: (Tuple[str, int, str]) -> None
+        """Record failed request to host, opening the circuit if needed."""
+        self._failing.add(urlident)
+        if self.cache.get(self._key(urlident, 'open')) is not None:
+            # the probe failed: open the circuit again.
+            return self._open(urlident)
+        failures_key = self._key(urlident, 'failures')
+        if self.cache.add(failures_key, 1, self.timeout):
+            failures = 1
+        else:
+            try:
+                failures = self.cache.incr(failures_key)
+            except ValueError:  # expired in the meantime
+                failures = 1
+                self.cache.add(failures_key, 1, self.timeout)
+        if failures >= self.threshold:
+            self._open(urlident)
+
+    def state(self, urlident):
+        # type: (Tuple[str, int, str]) -> str
+        """Return the state of the circuit for host."""
+        opened_until = self.cache.get(self._key(urlident, 'open'))
+        if opened_until is None:
+            return CLOSED
+        return OPEN if time.time() < opened_until else HALF_OPEN
+
+    def _open(self, urlident):
+        # type: (Tuple[str, int, str]) -> None
+        # the circuit stays half-open (no timeout) until a probe succeeds.
+        self.cache.set(
+            self._key(urlident, 'open'), time.time() + self.timeout, None)
+        self.cache.delete_many([
+            self._key(urlident, 'failures'),
+            self._key(urlident, 'probe'),
+        ])
+
+    def _key(self, urlident, name):
+        # type: (Tuple[str, int, str], str) -> str
+        scheme, port, host = urlident
+        return '{0}.{1}://{2}:{3}.{4}'.format(
+            self.key_prefix, scheme, host, port, name)
+
+    @property
+    def cache(self):
+        # type: () -> Any
+        if self._cache is None:
+            self._cache = MemoryCache()
+        elif isinstance(self._cache, string_types):
+            self._cache = self.app.caches[self._cache]
+        return self._cache
@@ -20,6 +20,7 @@ class Settings(object):
 
     default_chunksize = 10
     default_dispatcher = 'default'
+    default_fair_queuing = False
     default_event_choices = ()
     default_timeout = 3.0
     default_codecs = {MIME_JSON: json.dumps}
@@ -27,6 +28,17 @@ class Settings(object):
     default_retry = True
     default_retry_max = 10
     default_retry_delay = 60.0
+    default_retry_backoff = False
+    default_retry_backoff_max = 600.0
+    default_retry_jitter = True
+    default_response_classifier = 'thorn.request:classify_response'
+    default_circuit_breaker = False
+    default_circuit_breaker_threshold = 5
+    default_circuit_breaker_timeout = 30.0
+    default_circuit_breaker_cache = None
+    default_debounce_cache = 'default'
+    default_event_ttl = None
+    default_dead_letter_sink = None
     default_recipient_validators = [
         validators.block_internal_ips(),
         validators.ensure_protocol('http', 'https'),
@@ -35,6 +47,9 @@ class Settings(object):
     default_signal_honors_transaction = False
     default_hmac_signer = 'thorn.utils.hmac:compat_sign'
     default_allow_redirects = False
+    default_payload_store = None
+    default_payload_store_threshold = 256 * 1024
+    default_subscriber_cache_timeout = 60.0
 
     def __init__(self, app=None):
         self.app = app_or_default(app or self.app)
@@ -43,6 +58,16 @@ class Settings(object):
     def THORN_CHUNKSIZE(self):
         return self._get('THORN_CHUNKSIZE', self.default_chunksize)
 
+    @cached_property
+    def THORN_FAIR_QUEUING(self):
+        # type: () -> bool
+        return self._get('THORN_FAIR_QUEUING', self.default_fair_queuing)
+
+    @cached_property
+    def THORN_FAIR_QUEUING_WEIGHTS(self):
+        # type: () -> Mapping[Any, int]
+        return self._get_lazy('THORN_FAIR_QUEUING_WEIGHTS', dict)
+
     @cached_property
     def THORN_CODECS(self):
         return self._get('THORN_CODECS', self.default_codecs)
@@ -77,6 +102,17 @@ class Settings(object):
     def THORN_EVENT_TIMEOUT(self):
         return self._get('THORN_EVENT_TIMEOUT', self.default_timeout)
 
+    @cached_property
+    def THORN_EVENT_TTL(self):
+        # type: () -> Optional[float]
+        return self._get('THORN_EVENT_TTL', self.default_event_ttl)
+
+    @cached_property
+    def THORN_DEAD_LETTER_SINK(self):
+        # type: () -> Optional[Union[str, Callable]]
+        return self._get(
+            'THORN_DEAD_LETTER_SINK', self.default_dead_letter_sink)
+
     @cached_property
     def THORN_RETRY(self):
         return self._get('THORN_RETRY', self.default_retry)
@@ -89,6 +125,70 @@ class Settings(object):
     def THORN_RETRY_DELAY(self):
         return self._get('THORN_RETRY_DELAY', self.default_retry_delay)
 
+    @cached_property
+    def THORN_RETRY_BACKOFF(self):
+        # type: () -> Union[bool, float]
+        return self._get('THORN_RETRY_BACKOFF', self.default_retry_backoff)
+
+    @cached_property
+    def THORN_RETRY_BACKOFF_MAX(self):
+        # type: () -> float
+        return self._get(
+            'THORN_RETRY_BACKOFF_MAX', self.default_retry_backoff_max)
+
+    @cached_property
+    def THORN_RETRY_JITTER(self):
+        # type: () -> bool
+        return self._get('THORN_RETRY_JITTER', self.default_retry_jitter)
+
+    @cached_property
+    def THORN_RESPONSE_CLASSIFIER(self):
+        # type: () -> Union[str, Callable]
+        return self._get(
+            'THORN_RESPONSE_CLASSIFIER', self.default_response_classifier)
+
+    @cached_property
+    def THORN_CIRCUIT_BREAKER(self):
+        # type: () -> bool
+        return self._get(
+            'THORN_CIRCUIT_BREAKER', self.default_circuit_breaker)
+
+    @cached_property
+    def THORN_CIRCUIT_BREAKER_THRESHOLD(self):
+        # type: () -> int
+        return self._get(
+            'THORN_CIRCUIT_BREAKER_THRESHOLD',
+            self.default_circuit_breaker_threshold)
+
+    @cached_property
+    def THORN_CIRCUIT_BREAKER_TIMEOUT(self):
+        # type: () -> float
+        return self._get(
+            'THORN_CIRCUIT_BREAKER_TIMEOUT',
+            self.default_circuit_breaker_timeout)
+
+    @cached_property
+    def THORN_CIRCUIT_BREAKER_CACHE(self):
+        # type: () -> Optional[str]
+        return self._get(
+            'THORN_CIRCUIT_BREAKER_CACHE',
+            self.default_circuit_breaker_cache)
+
+    @cached_property
+    def THORN_DEBOUNCE_CACHE(self):
+        # type: () -> str
+        return self._get('THORN_DEBOUNCE_CACHE', self.default_debounce_cache)
+
+    @cached_property
+    def THORN_RATE_LIMITS(self):
+        # type: () -> Mapping[str, str]
+        return self._get_lazy('THORN_RATE_LIMITS', dict)
+
+    @cached_property
+    def THORN_EVENT_ROUTES(self):
+        # type: () -> Mapping[str, Union[str, Mapping[str, Any]]]
+        return self._get_lazy('THORN_EVENT_ROUTES', dict)
+
     @cached_property
     def THORN_RECIPIENT_VALIDATORS(self):
         return self._get_lazy(
@@ -107,6 +207,25 @@ class Settings(object):
         return self._get(
             'THORN_ALLOW_REDIRECTS', self.default_allow_redirects)
 
+    @cached_property
+    def THORN_PAYLOAD_STORE(self):
+        # type: () -> Optional[Union[str, BlobStore]]
+        return self._get('THORN_PAYLOAD_STORE', self.default_payload_store)
+
+    @cached_property
+    def THORN_PAYLOAD_STORE_THRESHOLD(self):
+        # type: () -> int
+        return self._get(
+            'THORN_PAYLOAD_STORE_THRESHOLD',
+            self.default_payload_store_threshold)
+
+    @cached_property
+    def THORN_SUBSCRIBER_CACHE_TIMEOUT(self):
+        # type: () -> float
+        return self._get(
+            'THORN_SUBSCRIBER_CACHE_TIMEOUT',
+            self.default_subscriber_cache_timeout)
+
     def _get(self, key, default=None):
         # type: (str, Any) -> Any
         return self._get_lazy(key, lambda: default)
@@ -1,8 +1,10 @@
 """Webhook decorators."""
 from __future__ import absolute_import, unicode_literals
 import inspect
+from collections import OrderedDict
 from itertools import chain
 from six import iteritems as items, itervalues as values
+from .events import ModelEventGroup
 from .utils.compat import bytes_if_py2
 
 
@@ -196,7 +198,19 @@ class WebhookCapable(object):
 
     def contribute_to_model(self, model):
         # type: (type) -> type
-        [event.connect_model(model) for event in values(self.events) if event]
+        # events connected to the same signal share a single handler,
+        # see thorn.events.ModelEventGroup.
+        groups = OrderedDict()
+        for event in values(self.events):
+            if event:
+                d = event.signal_dispatcher
+                key = d.combine_key if d is not None else id(event)
+                groups.setdefault(key, []).append(event)
+        for events in values(groups):
+            if len(events) > 1:
+                ModelEventGroup(events).connect_model(model)
+            else:
+                events[0].connect_model(model)
         model.webhooks = self
         model.webhook_events = self  # XXX remove for Thorn 2.0
         return model
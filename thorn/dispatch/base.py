@@ -1,31 +1,50 @@
 """Default webhook dispatcher."""
 from __future__ import absolute_import, unicode_literals
 
-from collections import deque
+from collections import OrderedDict, deque
 from functools import partial
 from itertools import chain
+from six import iteritems as items
 from weakref import ref
 
 from celery.utils.functional import maybe_list
 from vine import barrier
 
 from thorn._state import app_or_default
+from thorn.conf import MIME_JSON
 from thorn.exceptions import BufferNotEmpty
 from thorn.generic.models import AbstractSubscriber
-from thorn.utils.compat import restore_from_keys
-from thorn.utils.functional import traverse_subscribers
+from thorn.utils.compat import ContextVar, restore_from_keys, want_bytes
+from thorn.utils import json
+from thorn.utils.functional import (
+    chunks, event_patterns, parse_projection, project, traverse_subscribers,
+)
 
 __all__ = ['Dispatcher']
 
 
+class _BufferState(object):
+    """Event buffer state for the current context."""
+
+    def __init__(self, enabled=False, owner=None):
+        self.enabled = enabled
+        self.owner = owner
+        self.pending = deque()
+
+
 class Dispatcher(object):
     app = None
 
     def __init__(self, timeout=None, app=None, buffer=False):
         self.app = app_or_default(app or self.app)
-        self._buffer = buffer
-        self._buffer_owner = None
-        self.pending_outbound = deque()
+        # The buffer is local to the current context (thread/async task),
+        # so that buffering in one web request will never capture the
+        # events of another.  The state is replaced, never mutated,
+        # when buffering is enabled/disabled, as a task may be sharing
+        # the state of the context it was created in.
+        self._buffer_default = buffer
+        self._buffer_state = ContextVar(
+            'thorn_buffer_{0:#x}'.format(id(self)))
         self.timeout = (
             timeout if timeout is not None
             else self.app.settings.THORN_EVENT_TIMEOUT
@@ -35,10 +54,36 @@ class Dispatcher(object):
             self._stored_subscribers,
         ]
 
+    @property
+    def _buffer_context(self):
+        try:
+            return self._buffer_state.get()
+        except LookupError:
+            state = _BufferState(self._buffer_default)
+            self._buffer_state.set(state)
+            return state
+
+    @property
+    def _buffer(self):
+        return self._buffer_context.enabled
+
+    @property
+    def _buffer_owner(self):
+        return self._buffer_context.owner
+
+    @_buffer_owner.setter
+    def _buffer_owner(self, owner_ref):
+        self._buffer_context.owner = owner_ref
+
+    @property
+    def pending_outbound(self):
+        return self._buffer_context.pending
+
     def enable_buffer(self, owner=None):
         if not self._buffer:
-            self._buffer = True
-            self._buffer_owner = ref(owner) if owner else None
+            self._buffer_state.set(_BufferState(
+                enabled=True, owner=ref(owner) if owner else None,
+            ))
 
     def _is_buffer_owner(self, obj):
         owner_ref = self._buffer_owner
@@ -54,12 +99,103 @@ class Dispatcher(object):
                 if self.pending_outbound:
                     raise BufferNotEmpty(
                         'please flush_buffer(), before disabling it.')
-                self._buffer = False
+                self._buffer_state.set(_BufferState(enabled=False))
 
     def flush_buffer(self, owner=None):
         if not owner or self._is_buffer_owner(owner):
-            while self.pending_outbound:
-                self._dispatch_request(self.pending_outbound.popleft())
+            pending = self.pending_outbound
+            requests = deque(self.batch_requests(pending))
+            pending.clear()
+            while requests:
+                self._dispatch_request(requests.popleft())
+
+    def batch_requests(self, requests):
+        """Merge requests to subscribers accepting batched deliveries.
+
+        Requests to the same subscriber (using the json content type and
+        having a ``batch_size``) are merged into requests
+        of up to ``batch_size`` events each, see :meth:`merge_requests`.
+        """
+        batches = OrderedDict()
+        for request in requests:
+            if self.subscriber_batch_size(request.subscriber) > 1:
+                key = (str(request.subscriber.uuid),
+                       tuple(sorted(request.routing.items())))
+                batches.setdefault(key, []).append(request)
+            else:
+                yield request
+        for reqs in batches.values():
+            batch_size = self.subscriber_batch_size(reqs[0].subscriber)
+            for batch in chunks(iter(reqs), batch_size):
+                yield (self.merge_requests(batch) if len(batch) > 1
+                       else batch[0])
+
+    def subscriber_batch_size(self, subscriber):
+        # custom subscriber models may not support batching.
+        if subscriber.content_type != MIME_JSON:
+            return 1
+        return getattr(subscriber, 'batch_size', None) or 1
+
+    def merge_requests(self, requests):
+        """Merge requests to the same subscriber into a single request.
+
+        The body is a json array having an object for every request,
+        with the name of the event, the delivery id and the payload::
+
+            [{"event": "article.changed", "delivery": "...", "data": {...}},
+             ...]
+
+        The merged request will have the same outcome
+        (success or failure) as the requests it replaces.
+        """
+        first = requests[0]
+        timeouts = [r.timeout for r in requests]
+        deadlines = [r.deadline for r in requests]
+        batch = self.app.Request(
+            ','.join(OrderedDict.fromkeys(r.event for r in requests)),
+            self.prepare_body(self.encode_batch(requests)),
+            first.sender if all(
+                r.sender == first.sender for r in requests) else None,
+            first.subscriber,
+            timeout=None if None in timeouts else max(timeouts),
+            retry=first.retry,
+            retry_max=first.retry_max,
+            retry_delay=first.retry_delay,
+            retry_backoff=first.retry_backoff,
+            retry_backoff_max=first.retry_backoff_max,
+            retry_jitter=first.retry_jitter,
+            deadline=None if None in deadlines else max(deadlines),
+            queue=first.queue,
+            priority=first.priority,
+            recipient_validators=first._recipient_validators,
+            allow_keepalive=first.allow_keepalive,
+            batch=len(requests),
+        )
+        batch.then(
+            partial(self._on_batch_success, requests),
+            partial(self._on_batch_error, requests),
+        )
+        return batch
+
+    def encode_batch(self, requests):
+        # the request bodies are already encoded, so the array
+        # is built without decoding and encoding them again.
+        return '[{0}]'.format(','.join(
+            '{{"event": {0}, "delivery": {1}, "data": {2}}}'.format(
+                json.dumps(r.event), json.dumps(r.id),
+                r.data.decode('utf-8') if isinstance(r.data, bytes)
+                else r.data,
+            ) for r in requests
+        ))
+
+    def _on_batch_success(self, requests, batch):
+        for request in requests:
+            request.response = batch.response
+            request._p()
+
+    def _on_batch_error(self, requests, exc):
+        for request in requests:
+            request._p.throw(exc, propagate=False)
 
     def send(self, event, payload, sender,
              context=None, extra_subscribers=None,
@@ -74,6 +210,51 @@ class Dispatcher(object):
             )
         ])
 
+    def send_many(self, events):
+        """Send multiple events, fetching their subscribers together.
+
+        Arguments:
+            events (Sequence[Tuple[str, Any, Any, Dict]]): List of
+                ``(event, payload, sender, kwargs)`` tuples,
+                taking the same arguments as :meth:`send`.
+
+        Note:
+            Stored subscribers for all events having the same
+            sender are fetched using a single query.
+        """
+        stored = self.stored_subscribers_for_events(events)
+        return [
+            self.send(event, payload, sender,
+                      stored_subscribers=self.prefetched_for(
+                          stored, event, sender),
+                      **kwargs)
+            for event, payload, sender, kwargs in events
+        ]
+
+    def stored_subscribers_for_events(self, events):
+        """Return mapping of ``(sender, event)`` to stored subscribers."""
+        Subscribers = self.app.Subscribers
+        if not hasattr(Subscribers, 'matching_events'):
+            return {}  # custom subscriber model: fetched by send.
+        senders = OrderedDict()
+        for event, _, sender, _ in events:
+            names = senders.setdefault(self._sender_key(sender), (sender, []))
+            names[1].append(event)
+        stored = {}
+        for key, (sender, names) in items(senders):
+            subscribers = list(Subscribers.matching_events(names, user=sender))
+            for name in names:
+                patterns = event_patterns(name)
+                stored[(key, name)] = [
+                    s for s in subscribers if s.event in patterns]
+        return stored
+
+    def prefetched_for(self, stored, event, sender):
+        return stored.get((self._sender_key(sender), event))
+
+    def _sender_key(self, sender):
+        return getattr(sender, 'pk', sender)
+
     def dispatch_request(self, request):
         if self._buffer:
             self.pending_outbound.append(request)
@@ -85,30 +266,49 @@ class Dispatcher(object):
 
     def prepare_requests(self, event, payload, sender,
                          timeout=None, context=None,
-                         extra_subscribers=None, **kwargs):
-        # holds a cache of the payload serialized by content-type,
-        # built incrementally depending on what content-types are
-        # required by the subscribers.
+                         extra_subscribers=None, stored_subscribers=None,
+                         **kwargs):
+        # holds a cache of the payload serialized by content-type
+        # (and field projection), built incrementally depending on what
+        # content-types/projections are required by the subscribers.
         cache = {}
         timeout = timeout if timeout is not None else self.timeout
         context = context or {}
         return (
             self.app.Request(
                 event,
-                self.encode_cached(payload, cache, subscriber.content_type),
+                self.encode_cached(
+                    payload, cache, subscriber.content_type,
+                    self.subscriber_projection(subscriber),
+                ),
                 sender, subscriber,
                 timeout=timeout, **kwargs)
             for subscriber in self.subscribers_for_event(
-                event, sender, context, extra_subscribers)
+                event, sender, context, extra_subscribers,
+                stored_subscribers=stored_subscribers)
         )
 
-    def encode_cached(self, payload, cache, ctype):
+    def encode_cached(self, payload, cache, ctype, projection=None):
+        key = (ctype, projection) if projection else ctype
         try:
-            return cache[ctype]
+            return cache[key]
         except KeyError:
-            value = cache[ctype] = self.encode_payload(payload, ctype)
+            if projection:
+                payload = project(payload, projection)
+            value = cache[key] = self.prepare_body(
+                self.encode_payload(payload, ctype))
             return value
 
+    def prepare_body(self, body):
+        # The encoded payload is converted to bytes once, and that buffer
+        # is then shared by all requests using the same content type,
+        # as neither signing or posting it will have to copy it again.
+        return want_bytes(body)
+
+    def subscriber_projection(self, subscriber):
+        # custom subscriber models may not support projections.
+        return parse_projection(getattr(subscriber, 'projection', None))
+
     def encode_payload(self, data, content_type):
         try:
             encode = self.app.settings.THORN_CODECS[content_type]
@@ -118,13 +318,25 @@ class Dispatcher(object):
             return encode(data)
 
     def subscribers_for_event(self, name,
-                              sender=None, context={}, extra_subscribers=None):
+                              sender=None, context={}, extra_subscribers=None,
+                              stored_subscribers=None):
         """Return a list of :class:`~thorn.django.models.Subscriber`
-        subscribing to an event by name (optionally filtered by sender)."""
+        subscribing to an event by name (optionally filtered by sender).
+
+        Stored subscribers already fetched (e.g. by :meth:`send_many`)
+        can be passed using the ``stored_subscribers`` argument.
+        """
+        sources = self.subscriber_sources
+        if stored_subscribers is not None:
+            sources = [
+                partial(self._prefetched_subscribers, stored_subscribers)
+                if source == self._stored_subscribers else source
+                for source in sources
+            ]
         return chain(*[
             source(name, sender=sender, **context)
             for source in chain(
-                self.subscriber_sources,
+                sources,
                 [partial(self._traverse_subscribers, extra_subscribers or [])],
             )
         ])
@@ -148,6 +360,9 @@ class Dispatcher(object):
     def _stored_subscribers(self, name, sender=None, **context):
         return self.app.Subscribers.matching(event=name, user=sender)
 
+    def _prefetched_subscribers(self, subscribers, name, **context):
+        return subscribers
+
     def __reduce__(self):
         return restore_from_keys, (type(self), (), self.__reduce_keys__())
 
@@ -1,27 +1,111 @@
 """Celery-based webhook dispatcher."""
 from __future__ import absolute_import, unicode_literals
 
+from collections import OrderedDict, deque
+from itertools import chain, groupby
+from operator import attrgetter
+from six import iteritems as items, text_type
+
 from celery import group
 
-from thorn.tasks import send_event, dispatch_requests
-from thorn.utils.functional import chunks
+from thorn.request import expires_in, routing_options
+from thorn.tasks import send_event, send_events, dispatch_requests
+from thorn.utils.functional import chunks, interleave
 
 from . import base
+from .wire import compact_requests
 
 __all__ = ['Dispatcher', 'WorkerDispatcher']
 
 
 class _CeleryDispatcher(base.Dispatcher):
 
+    def prepare_body(self, body):
+        # keep text so that the body can be serialized in task messages,
+        # the worker converts it to bytes (see dispatch_requests).
+        return body
+
     def as_request_group(self, requests):
+        # requests usually share the same body, so every distinct
+        # body is only offloaded to the payload store once.
+        offloaded = {}
         return group(
-            dispatch_requests.s([req.as_dict() for req in chunk])
+            dispatch_requests.s(compact_requests([
+                self.as_request_message(req, offloaded) for req in chunk
+            ])).set(expires=self.batch_expires(chunk), **chunk[0].routing)
             for chunk in self.group_requests(requests)
         )
 
+    def batch_expires(self, requests):
+        return self.latest_expires([req.deadline for req in requests])
+
+    def latest_expires(self, deadlines):
+        # the batch expires when all of its requests have expired.
+        if deadlines and None not in deadlines:
+            return expires_in(max(deadlines), app=self.app)
+
+    def as_request_message(self, request, offloaded):
+        message = request.as_dict()
+        data = message['data']
+        if isinstance(data, text_type):
+            try:
+                message['data'] = offloaded[data]
+            except KeyError:
+                message['data'] = offloaded[data] = (
+                    self.app.claim_check.offload_body(data))
+        if self.is_stored_subscriber(request.subscriber):
+            # workers will look up the subscriber by uuid.
+            message['subscriber'] = message['subscriber']['uuid']
+        return message
+
+    def is_stored_subscriber(self, subscriber):
+        # only subscribers stored in the database can be resolved by
+        # the worker, others (e.g. from THORN_SUBSCRIBERS) are sent in full.
+        return getattr(subscriber, 'pk', None) is not None
+
     def group_requests(self, requests):
-        """Group requests by keep-alive host/port/scheme ident."""
-        return chunks(iter(requests), self.app.settings.THORN_CHUNKSIZE)
+        """Group requests by keep-alive host/port/scheme ident.
+
+        Requests for events routed to different queues (or having
+        different priorities) are never in the same chunk.
+
+        With :setting:`THORN_FAIR_QUEUING` enabled the chunks of different
+        subscriber owners are interleaved, see :meth:`fair_chunks`.
+        """
+        chunksize = self.app.settings.THORN_CHUNKSIZE
+        group_chunks = (
+            self.fair_chunks if self.app.settings.THORN_FAIR_QUEUING
+            else chunks)
+        return chain.from_iterable(
+            group_chunks(iter(reqs), chunksize)
+            for _, reqs in groupby(requests, key=attrgetter('routing'))
+        )
+
+    def fair_chunks(self, requests, n):
+        """Split requests into per-owner chunks, interleaved by weight.
+
+        Every owner (:attr:`Subscriber.user <thorn.django.models.Subscriber>`)
+        has a lane of its own, and the lanes take turns so that an owner
+        having thousands of subscriptions will not delay the delivery
+        to all other owners.  Weights (default 1) are configured
+        using :setting:`THORN_FAIR_QUEUING_WEIGHTS`.
+        """
+        lanes = OrderedDict()
+        for request in requests:
+            owner = self.subscriber_owner(request.subscriber)
+            lanes.setdefault(owner, []).append(request)
+        weights = self.app.settings.THORN_FAIR_QUEUING_WEIGHTS
+        return interleave(
+            [chunks(iter(reqs), n) for reqs in lanes.values()],
+            [weights.get(owner, 1) for owner in lanes],
+        )
+
+    def subscriber_owner(self, subscriber):
+        # avoid loading the user of Django subscribers only to get its pk.
+        try:
+            return subscriber.user_id
+        except AttributeError:
+            return subscriber.user_ident()
 
     def _compare_requests(self, a, b):
         return a.urlident == b.urlident
@@ -38,16 +122,48 @@ class Dispatcher(_CeleryDispatcher):
 
     def send(self, event, payload, sender,
              timeout=None, context=None, **kwargs):
+        expires = expires_in(kwargs.get('deadline'), app=self.app)
         return send_event.s(
-            event, payload,
+            event, self.app.claim_check.offload_payload(payload),
             sender.pk if sender else sender, timeout, context, **kwargs
-        ).apply_async()
+        ).apply_async(expires=expires, **routing_options(kwargs))
+
+    def send_many(self, events):
+        """Send multiple events using a single task per route.
+
+        The worker then fetches the subscribers of all the events
+        together, see :func:`~thorn.tasks.send_events`.
+        """
+        routes = OrderedDict()
+        for event, payload, sender, kwargs in events:
+            route = routing_options(kwargs)
+            routes.setdefault(tuple(sorted(items(route))), []).append(
+                self.as_event_message(event, payload, sender, kwargs))
+        return [
+            send_events.s(messages).apply_async(
+                expires=self.latest_expires(
+                    [m.get('deadline') for m in messages]),
+                **dict(route))
+            for route, messages in items(routes)
+        ]
+
+    def as_event_message(self, event, payload, sender, kwargs):
+        return dict(
+            kwargs,
+            event=event,
+            payload=self.app.claim_check.offload_payload(payload),
+            sender=sender.pk if sender else sender,
+        )
 
-    def flush_buffer(self):
-        # XXX Not thread-safe
-        g = self.as_request_group(self.pending_outbound)
-        self.pending_outbound.clear()
-        g.delay()
+    def flush_buffer(self, owner=None):
+        if not owner or self._is_buffer_owner(owner):
+            # the buffer is local to this context, but it may be shared
+            # with tasks created in it, so we take the pending requests
+            # before sending them.
+            state = self._buffer_context
+            pending, state.pending = state.pending, deque()
+            if pending:
+                self.as_request_group(self.batch_requests(pending)).delay()
 
 
 class WorkerDispatcher(_CeleryDispatcher):
@@ -63,3 +179,14 @@ class WorkerDispatcher(_CeleryDispatcher):
         # connections as requests with the same host are grouped together.
         return self.as_request_group(self.prepare_requests(
             event, payload, sender, timeout, context, **kwargs)).delay()
+
+    def send_many(self, events):
+        # requests for all the events are chunked together.
+        stored = self.stored_subscribers_for_events(events)
+        return self.as_request_group(chain.from_iterable(
+            self.prepare_requests(
+                event, payload, sender,
+                stored_subscribers=self.prefetched_for(stored, event, sender),
+                **kwargs)
+            for event, payload, sender, kwargs in events
+        )).delay()
@@ -0,0 +1,111 @@
+"""Compact message format for batches of HTTP requests.
+
+Requests in a :func:`~thorn.tasks.dispatch_requests` batch usually
+have most of their fields in common (the event, the payload, timeouts,
+recipient validators, and so on), so instead of repeating these for every
+request the fields sharing the same value are hoisted to the batch level::
+
+    {'shared': {'event': 'article.changed', 'data': '...', ...},
+     'requests': [{'id': '...', 'subscriber': '<uuid>'}, ...]}
+
+Subscribers stored in the database are only referenced by uuid,
+and workers resolve them using a :class:`SubscriberCache`.  This also
+means secrets like the HMAC key are not sent through the broker.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from six import iteritems as items, string_types
+
+from celery.utils.functional import LRUCache
+from vine.five import monotonic
+
+from thorn._state import app_or_default
+
+__all__ = [
+    'compact_requests', 'expand_requests', 'is_compact', 'SubscriberCache',
+]
+
+
+def compact_requests(messages):
+    # type: (Sequence[Dict]) -> Dict[str, Any]
+    """Hoist fields having the same value in all requests to batch level."""
+    first, rest = messages[0], messages[1:]
+    shared = {
+        key: value for key, value in items(first)
+        if all(key in m and m[key] == value for m in rest)
+    }
+    return {
+        'shared': shared,
+        'requests': [
+            {k: v for k, v in items(m) if k not in shared}
+            for m in messages
+        ],
+    }
+
+
+def expand_requests(batch):
+    # type: (Dict[str, Any]) -> List[Dict]
+    """Expand compact batch into list of request dictionaries."""
+    shared = batch['shared']
+    return [dict(shared, **request) for request in batch['requests']]
+
+
+def is_compact(batch):
+    # type: (Any) -> bool
+    """Return true if batch is in the compact format."""
+    return isinstance(batch, dict) and 'requests' in batch
+
+
+def is_subscriber_ref(subscriber):
+    # type: (Any) -> bool
+    """Return true if subscriber is a reference (uuid) to a subscriber."""
+    return isinstance(subscriber, string_types)
+
+
+class SubscriberCache(object):
+    """Worker-side cache of subscribers, looked up by uuid.
+
+    Entries are kept for :setting:`THORN_SUBSCRIBER_CACHE_TIMEOUT` seconds,
+    so changes to a subscriber may take that long to have effect.
+    """
+
+    app = None
+
+    def __init__(self, timeout=None, limit=1000, app=None):
+        # type: (float, int, App) -> None
+        self.app = app_or_default(app or self.app)
+        self.timeout = (
+            timeout if timeout is not None
+            else self.app.settings.THORN_SUBSCRIBER_CACHE_TIMEOUT)
+        self._cache = LRUCache(limit=limit)
+
+    def get(self, uuid):
+        # type: (str) -> Optional[Subscriber]
+        """Get subscriber by uuid, or :const:`None` if it does not exist."""
+        return self.get_many([uuid]).get(uuid)
+
+    def get_many(self, uuids):
+        # type: (Sequence[str]) -> Dict[str, Subscriber]
+        """Get subscribers by uuid using a single query for missing entries.
+
+        Subscribers that no longer exist are not included in the result.
+        """
+        now = monotonic()
+        found, missing = {}, set()
+        for uuid in uuids:
+            entry = self._cache.get(uuid)
+            if entry is not None and entry[0] > now:
+                found[uuid] = entry[1]
+            else:
+                missing.add(uuid)
+        if missing:
+            expires = now + self.timeout
+            for subscriber in self.app.Subscribers.with_uuids(missing):
+                uuid = str(subscriber.uuid)
+                self._cache[uuid] = (expires, subscriber)
+                found[uuid] = subscriber
+        return found
+
+    def clear(self):
+        # type: () -> None
+        self._cache.clear()
@@ -4,6 +4,8 @@ from __future__ import absolute_import, unicode_literals
 from django.db import models
 from django.db.models.query import Q
 
+from thorn.utils.functional import event_patterns
+
 __all__ = ['SubscriberQuerySet', 'SubscriberManager']
 
 
@@ -24,9 +26,19 @@ class SubscriberQuerySet(models.QuerySet):
             Q(event__exact='*.{0}'.format(rest))
         )
 
+    def matching_events(self, events, user=None):
+        # single query for the subscribers of multiple events,
+        # see Dispatcher.send_many.
+        patterns = {p for event in events for p in event_patterns(event)}
+        return self.filter(
+            event__in=sorted(patterns)).matching_user_or_all(user)
+
     def matching_user_or_all(self, user):
         return self.filter(user=user) if user else self
 
+    def with_uuids(self, uuids):
+        return self.filter(uuid__in=list(uuids))
+
 
 class SubscriberManager(models.Manager.from_queryset(SubscriberQuerySet)):
     pass
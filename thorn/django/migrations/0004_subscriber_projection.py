@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0003_auto_20171024_0654'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='projection',
+            field=models.TextField(
+                blank=True,
+                default='',
+                help_text=(
+                    'Comma separated list of dotted payload paths to send '
+                    '(e.g. "event, data.title"), or empty to send all '
+                    'fields.'),
+                verbose_name='projection'),
+        ),
+    ]
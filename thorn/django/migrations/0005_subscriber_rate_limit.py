@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0004_subscriber_projection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='rate_limit',
+            field=models.CharField(
+                blank=True,
+                default='',
+                help_text=(
+                    'Maximum rate of requests to this callback '
+                    '(e.g. "100/s", "600/m"), or empty for no limit.'),
+                max_length=32,
+                verbose_name='rate limit'),
+        ),
+    ]
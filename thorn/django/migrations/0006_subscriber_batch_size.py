@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0005_subscriber_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='batch_size',
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text=(
+                    'Maximum number of events delivered together in a '
+                    'single request, or 0 to deliver every event by itself.'),
+                verbose_name='batch size'),
+        ),
+    ]
@@ -92,6 +92,33 @@ class Subscriber(models.Model, SubscriberModelMixin):
         help_text='Desired content type for requests to this callback.'
     )
 
+    projection = models.TextField(
+        _('projection'),
+        blank=True,
+        default='',
+        help_text=_(
+            'Comma separated list of dotted payload paths to send '
+            '(e.g. "event, data.title"), or empty to send all fields.'),
+    )
+
+    rate_limit = models.CharField(
+        _('rate limit'),
+        max_length=32,
+        blank=True,
+        default='',
+        help_text=_(
+            'Maximum rate of requests to this callback (e.g. "100/s", '
+            '"600/m"), or empty for no limit.'),
+    )
+
+    batch_size = models.PositiveIntegerField(
+        _('batch size'),
+        default=0,
+        help_text=_(
+            'Maximum number of events delivered together in a single '
+            'request, or 0 to deliver every event by itself.'),
+    )
+
     created_at = models.DateTimeField(
         _('created at'), editable=False, auto_now_add=True)
 
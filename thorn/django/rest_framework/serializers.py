@@ -25,6 +25,7 @@ class SubscriberSerializer(serializers.HyperlinkedModelSerializer):
         fields = (
             'event', 'url', 'content_type', 'user',
             'id', 'created_at', 'updated_at', 'subscription',
-            'hmac_secret', 'hmac_digest',
+            'hmac_secret', 'hmac_digest', 'projection', 'rate_limit',
+            'batch_size',
         )
         read_only_fields = ('id', 'created_at', 'updated_at', 'subscription')
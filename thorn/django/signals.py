@@ -3,13 +3,15 @@ from __future__ import absolute_import, unicode_literals
 
 from operator import attrgetter
 
-from django.core.exceptions import ObjectDoesNotExist
+from celery.utils.imports import symbol_by_name
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
 
 from thorn.generic.signals import signal_dispatcher
 
 from .utils import serialize_model
 
 __all__ = [
+    'PreviousVersionTracker',
     'dispatch_on_create',
     'dispatch_on_change',
     'dispatch_on_delete',
@@ -19,6 +21,135 @@ __all__ = [
 ]
 
 
+class ModelSnapshot(object):
+    """Previous version of a model instance, as captured by a snapshot."""
+
+    def __init__(self, fields):
+        # type: (Mapping[str, Any]) -> None
+        self.__dict__.update(fields)
+
+
+class PreviousVersionTracker(object):
+    """Keeps the previous version of instances being saved.
+
+    Transition filters (``__now_*``) and delta mode compare the instance
+    being saved with the version currently stored in the database, which
+    is set as ``instance._previous_version`` by a ``pre_save`` handler.
+
+    There's a single handler for every model, fetching the union
+    of the fields used by all the events for that model:
+
+    - Only the fields used by transition filters are fetched
+      (using ``.only()``), or the whole row if any event needs
+      all fields (e.g. in delta mode).
+
+    - When all events for a model enable ``snapshot``, the values of these
+      fields are captured when instances are loaded (``post_init``) and
+      saved (``post_save``), so that no query is needed at all.
+      Snapshots cannot be used for relation fields.
+    """
+
+    #: Instance attribute used to store snapshots.
+    attr = '_thorn_snapshot'
+
+    def __init__(self):
+        # model -> set of field names, or None for all fields.
+        self.fields = {}
+        # model -> snapshot enabled by every event for that model.
+        self.snapshots = {}
+
+    def track(self, model, fields=None, snapshot=False):
+        # type: (Any, Set[str], bool) -> None
+        """Track previous versions of ``model`` instances."""
+        fields = self._concrete_fields(model, fields)
+        snapshot = snapshot and self._can_snapshot(model, fields)
+        if model in self.fields:
+            previous = self.fields[model]
+            fields = (
+                None if fields is None or previous is None
+                else previous | fields)
+            snapshot = snapshot and self.snapshots[model]
+        self.fields[model] = fields
+        self.snapshots[model] = snapshot
+        uid = 'thorn.previous_version.{0:#x}'.format(id(model))
+        self._connect('pre_save', self.on_pre_save, model, uid)
+        if self.uses_snapshots(model):
+            self._connect('post_init', self.on_post_init, model, uid)
+            self._connect('post_save', self.on_post_save, model, uid)
+
+    def uses_snapshots(self, model):
+        # type: (Any) -> bool
+        return bool(self.snapshots.get(model) and self.fields.get(model))
+
+    def on_pre_save(self, sender, instance, raw=False, **kwargs):
+        if raw or not instance.pk:
+            return
+        previous = self.from_snapshot(sender, instance)
+        if previous is None:
+            fields = self.fields.get(sender)
+            objects = sender.objects.only(*fields) if fields else (
+                sender.objects)
+            try:
+                previous = objects.get(pk=instance.pk)
+            except ObjectDoesNotExist:
+                return
+        instance._previous_version = previous
+
+    def on_post_init(self, sender, instance, **kwargs):
+        self.take_snapshot(sender, instance)
+
+    def on_post_save(self, sender, instance, raw=False, **kwargs):
+        # the values saved are the previous version for the next save.
+        self.take_snapshot(sender, instance)
+
+    def take_snapshot(self, sender, instance):
+        if self.uses_snapshots(sender):
+            # deferred fields are left out, and will be fetched
+            # if the instance is saved (see from_snapshot).
+            values = instance.__dict__
+            setattr(instance, self.attr, {
+                field: values[field]
+                for field in self.fields[sender] if field in values
+            })
+
+    def from_snapshot(self, sender, instance):
+        # type: (Any, Any) -> Optional[ModelSnapshot]
+        # instances not loaded from the database have
+        # a snapshot of the values they were created with.
+        if self.uses_snapshots(sender) and not instance._state.adding:
+            snapshot = instance.__dict__.get(self.attr)
+            if snapshot is not None and len(snapshot) == len(
+                    self.fields[sender]):
+                return ModelSnapshot(snapshot)
+
+    def _concrete_fields(self, model, fields):
+        # type: (Any, Set[str]) -> Optional[Set[str]]
+        # the full row is needed if the filter uses anything else than
+        # a concrete field (e.g. a property).
+        if not fields or model is None:
+            return None
+        try:
+            if not all(model._meta.get_field(f).concrete for f in fields):
+                return None
+        except FieldDoesNotExist:
+            return None
+        return set(fields)
+
+    def _can_snapshot(self, model, fields):
+        # type: (Any, Optional[Set[str]]) -> bool
+        # snapshots store the raw values of fields, not related objects.
+        return fields is not None and not any(
+            model._meta.get_field(f).is_relation for f in fields)
+
+    def _connect(self, signal, handler, model, uid):
+        symbol_by_name('django.db.models.signals.' + signal).connect(
+            handler, sender=model, weak=False, dispatch_uid=uid)
+
+
+#: Tracker used by :class:`dispatch_on_change`.
+previous_versions = PreviousVersionTracker()
+
+
 class dispatch_on_create(signal_dispatcher):
 
     def setup_signals(self):
@@ -30,18 +161,36 @@ class dispatch_on_create(signal_dispatcher):
 
 class dispatch_on_change(signal_dispatcher):
 
+    #: Fields needed from the previous version of the instance
+    #: when :attr:`use_transitions` is enabled (:const:`None` for all).
+    tracked_fields = None
+
+    #: Capture the previous version when instances are loaded, instead
+    #: of fetching it before saving (see :class:`PreviousVersionTracker`).
+    snapshot = False
+
+    #: Tracker setting the previous version of instances.
+    tracker = previous_versions
+
     def setup_signals(self):
-        return {
-            'django.db.models.signals.pre_save': self.on_pre_save,
-            'django.db.models.signals.post_save': self,
-        }
+        return {'django.db.models.signals.post_save': self}
 
-    def on_pre_save(self, instance, sender, raw=False, **kwargs):
-        if self.use_transitions and not raw and instance.pk:
-            try:
-                instance._previous_version = sender.objects.get(pk=instance.pk)
-            except ObjectDoesNotExist:
-                pass
+    def combine(self, dispatchers, fun):
+        d = super(dispatch_on_change, self).combine(dispatchers, fun)
+        tracking = [x for x in dispatchers if x.use_transitions]
+        fields = [x.tracked_fields for x in tracking]
+        d.tracked_fields = (
+            None if None in fields else set().union(*fields))
+        d.snapshot = all(x.snapshot for x in tracking)
+        d.tracker = self.tracker
+        return d
+
+    def connect(self, sender=None, weak=False, **kwargs):
+        super(dispatch_on_change, self).connect(
+            sender=sender, weak=weak, **kwargs)
+        if self.use_transitions:
+            self.tracker.track(
+                sender, fields=self.tracked_fields, snapshot=self.snapshot)
 
     def should_dispatch(self, instance, created=False, raw=False, **kwargs):
         return not raw and not created
@@ -58,6 +207,7 @@ class dispatch_on_m2m_change(signal_dispatcher):
     def __init__(self, fun, related_field, **kwargs):
         super(dispatch_on_m2m_change, self).__init__(fun, **kwargs)
         self.related_field = related_field
+        self.args = (related_field,)
         self.actions = self.setup_actions()
 
     def setup_actions(self):
@@ -26,6 +26,8 @@ class DjangoEnv(object):
     subscriber_cls = 'thorn.django.models:Subscriber'
     signals_cls = 'thorn.django.signals'
     reverse_cls = 'django.urls:reverse'
+    caches_cls = 'django.core.cache:caches'
+    apps_cls = 'django.apps:apps'
 
     def on_commit(self, fun, *args, **kwargs):
         if args or kwargs:
@@ -62,3 +64,10 @@ class DjangoEnv(object):
     @cached_property
     def reverse(self):
         return symbol_by_name(self.reverse_cls)
+
+    def get_model(self, label):
+        return symbol_by_name(self.apps_cls).get_model(label)
+
+    @cached_property
+    def caches(self):
+        return symbol_by_name(self.caches_cls)
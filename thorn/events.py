@@ -1,21 +1,28 @@
 """User-defined webhook events."""
 from __future__ import absolute_import, unicode_literals
 
+import time
+
+from collections import OrderedDict
 from operator import attrgetter
-from six import iteritems as items, iterkeys as keys
+from six import iteritems as items, iterkeys as keys, string_types
 from weakref import WeakSet
 
 from celery.utils import cached_property
 
 from ._state import app_or_default
 from .utils.compat import bytes_if_py2, restore_from_keys
-from .utils.functional import Q
+from .utils.functional import Q, event_patterns
 from .utils.log import get_logger
 
-__all__ = ['Event', 'ModelEvent']
+__all__ = ['Event', 'ModelEvent', 'ModelEventGroup']
 
 E_DISPATCH_RAISED_ERROR = 'Event %r dispatch raised: %r'
 
+#: Extra seconds a debounce key is kept after the debounce window,
+#: in case the worker is late executing the delayed delivery.
+DEBOUNCE_GRACE = 60.0
+
 logger = get_logger(__name__)
 
 
@@ -24,6 +31,17 @@ def _true(*args, **kwargs):
     return True
 
 
+def _memoized(memo, key, fun, *args):
+    # type: (Optional[Dict], Any, Callable, *Any) -> Any
+    if memo is None:
+        return fun(*args)
+    try:
+        return memo[key]
+    except KeyError:
+        value = memo[key] = fun(*args)
+        return value
+
+
 class Event(object):
     """Webhook Event.
 
@@ -39,6 +57,15 @@ class Event(object):
             Disabled by default.
         retry_max (int): Max number of retries (3 by default).
         retry_delay (float): Delay between retries (60 seconds by default).
+        retry_backoff (Union[bool, float]): Enable exponential backoff
+            between retries, starting at ``retry_delay`` seconds (or the
+            number of seconds specified) and doubling for every retry.
+            Default is taken from the :setting:`THORN_RETRY_BACKOFF` setting.
+        retry_backoff_max (float): Maximum delay between retries when
+            using backoff (:setting:`THORN_RETRY_BACKOFF_MAX`).
+        retry_jitter (bool): Randomize backoff delays
+            (:setting:`THORN_RETRY_JITTER`), so that requests failing at
+            the same time are not all retried at the same time.
         recipient_validators (Sequence): List of functions validating the
             recipient URL string.  Functions must raise an error if the URL is
             blocked.  Default is to only allow HTTP and HTTPS, with respective
@@ -57,6 +84,16 @@ class Event(object):
             event payloads,
         allow_keepalive: Flag to disable HTTP connection keepalive
             for this event only.  Keepalive is enabled by default.
+        ttl (float): Time to live in seconds.  Requests that have not been
+            delivered within this time after the event was sent are dropped
+            (or passed to the :setting:`THORN_DEAD_LETTER_SINK`), instead
+            of being sent or retried.  Default is taken from the
+            :setting:`THORN_EVENT_TTL` setting (no limit).
+        queue (str): Celery queue used for the tasks delivering this event.
+            Default is taken from the :setting:`THORN_EVENT_ROUTES` setting,
+            or the Celery routing configuration.
+        priority (int): Celery message priority for the tasks delivering
+            this event (:setting:`THORN_EVENT_ROUTES`).
 
     Warning:
         :func:`~thorn.validators.block_internal_ips` will only
@@ -74,15 +111,24 @@ class Event(object):
                  retry=None, retry_max=None, retry_delay=None, app=None,
                  recipient_validators=None, subscribers=None,
                  request_data=None, allow_keepalive=None,
+                 retry_backoff=None, retry_backoff_max=None,
+                 retry_jitter=None, ttl=None, queue=None, priority=None,
                  **kwargs):
         # type: (str, float, Dispatcher, bool, int, float, App,
-        #        List, Mapping, Dict, bool) -> None
+        #        List, Mapping, Dict, bool, Union[bool, float],
+        #        float, bool, float, str, int) -> None
         self.name = name
         self.timeout = timeout
         self._dispatcher = dispatcher
         self.retry = retry
         self.retry_max = retry_max
         self.retry_delay = retry_delay
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.retry_jitter = retry_jitter
+        self.ttl = ttl
+        self.queue = queue
+        self.priority = priority
         self.request_data = request_data
         if allow_keepalive is not None:
             self.allow_keepalive = allow_keepalive
@@ -133,19 +179,75 @@ class Event(object):
               timeout=None, on_timeout=None, context=None):
         # type: (str, Any, Dict, Any, Callable,
         #        Callable, float, Callable, Dict) -> promise
+        name, payload, sender, kwargs = self._prepare_send(
+            name, data, headers=headers, sender=sender,
+            on_success=on_success, on_error=on_error,
+            timeout=timeout, on_timeout=on_timeout, context=context,
+        )
+        return self.dispatcher.send(name, payload, sender, **kwargs)
+
+    def _prepare_send(self, name, data, headers=None, sender=None,
+                      on_success=None, on_error=None,
+                      timeout=None, on_timeout=None, context=None):
+        # type: (str, Any, Dict, Any, Callable, Callable, float,
+        #        Callable, Dict) -> Tuple[str, Any, Any, Dict]
+        # arguments for Dispatcher.send, see also Dispatcher.send_many.
         timeout = timeout if timeout is not None else self.timeout
-        return self.dispatcher.send(
-            name, self.prepare_payload(data), sender,
+        return name, self.prepare_payload(data), sender, dict(
             headers=headers,
             context=context,
             on_success=on_success, on_error=on_error,
             timeout=timeout, on_timeout=on_timeout, retry=self.retry,
             retry_max=self.retry_max, retry_delay=self.retry_delay,
+            retry_backoff=self.retry_backoff,
+            retry_backoff_max=self.retry_backoff_max,
+            retry_jitter=self.retry_jitter,
+            deadline=self.deadline(),
             recipient_validators=self.prepared_recipient_validators,
             extra_subscribers=self._subscribers,
             allow_keepalive=self.allow_keepalive,
+            **self.routing(name)
         )
 
+    def deadline(self, now=None):
+        # type: (float) -> Optional[float]
+        """Return delivery deadline (as a timestamp) for event sent now."""
+        ttl = self.ttl if self.ttl is not None else (
+            self.app.settings.THORN_EVENT_TTL)
+        if ttl is not None:
+            return (now if now is not None else time.time()) + ttl
+
+    def routing(self, name=None):
+        # type: (str) -> Dict[str, Any]
+        """Return Celery routing options (queue, priority) for event.
+
+        Options set for the event take precedence over routes configured
+        by the :setting:`THORN_EVENT_ROUTES` setting, that are matched
+        by event name (e.g. ``"order.created"``), or using
+        ``"order.*"``, ``"*.created"`` and ``"*"`` (in that order).
+        """
+        route = self._configured_route(name or self.name)
+        if self.queue is not None:
+            route['queue'] = self.queue
+        if self.priority is not None:
+            route['priority'] = self.priority
+        return route
+
+    def _configured_route(self, name):
+        # type: (str) -> Dict[str, Any]
+        routes = self.app.settings.THORN_EVENT_ROUTES
+        if routes:
+            for key in event_patterns(name):
+                try:
+                    route = routes[key]
+                except KeyError:
+                    pass
+                else:
+                    if isinstance(route, string_types):
+                        return {'queue': route}  # name of queue.
+                    return dict(route)
+        return {}
+
     def __repr__(self):
         # type: () -> str
         return bytes_if_py2('<{0}: {1} ({2:#x})>'.format(
@@ -163,6 +265,12 @@ class Event(object):
             'retry': self.retry,
             'retry_max': self.retry_max,
             'retry_delay': self.retry_delay,
+            'retry_backoff': self.retry_backoff,
+            'retry_backoff_max': self.retry_backoff_max,
+            'retry_jitter': self.retry_jitter,
+            'ttl': self.ttl,
+            'queue': self.queue,
+            'priority': self.priority,
             'subscribers': self._subscribers,
             'request_data': self.request_data,
             'allow_keepalive': self.allow_keepalive,
@@ -243,6 +351,45 @@ class ModelEvent(Event):
 
             .. versionadded:: 1.5
 
+        delta (bool): If enabled change events will only send the fields
+            that changed since the previous version of the instance,
+            along with the primary key of the instance:
+            ``{"pk": 1, "changed": {"state": "PUBLISHED"}}``.
+
+            The previous version of the instance must be available,
+            so enabling this requires an extra query at ``pre_save``
+            (like transition filters do).  Events without a previous
+            version (e.g. on create) still send the full payload.
+
+            Disabled by default.
+
+        debounce (float): Debounce window in seconds.  When enabled,
+            changes to the same instance within the window are collapsed
+            into a single delivery, sent at the end of the window and
+            carrying the latest state of the instance.
+
+            The delivery is sent by a Celery worker (see
+            :func:`~thorn.tasks.send_debounced`), and pending deliveries are
+            tracked using the :setting:`THORN_DEBOUNCE_CACHE` cache.
+            Delta mode is not supported for debounced events, as there is
+            no previous version of the instance at delivery time.
+
+            Disabled by default.
+
+        snapshot (bool): Transition filters (and delta mode) need the
+            previous version of the instance, that is fetched from the
+            database before saving.  Only the fields used by transition
+            filters are fetched, but when snapshots are enabled the values
+            of these fields are recorded when the instance is loaded,
+            so that no query is needed at all.
+
+            This adds a small cost to loading every instance of the model,
+            and only works if every event for the model enables it, and the
+            filters only use fields that are not relations.
+            See :class:`~thorn.django.signals.PreviousVersionTracker`.
+
+            Disabled by default.
+
         signal_dispatcher (~thorn.django.signals.signal_dispatcher):
             Custom signal_dispatcher used to connect this event to a
             model signal.
@@ -282,10 +429,10 @@ class ModelEvent(Event):
 
         # _filterargs is set by __reduce__ to restore *args
         restored_args = kwargs.get('_filterargs') or ()
-        self._init_attrs(**kwargs)
         self._filter_predicate = (
             Q(*args + restored_args, **self.filter_fields)
             if args or self.filter_fields else _true)
+        self._init_attrs(**kwargs)
 
     def _init_attrs(self,
                     reverse=None,
@@ -293,11 +440,17 @@ class ModelEvent(Event):
                     signal_dispatcher=None,
                     signal_honors_transaction=None,
                     propagate_errors=False,
+                    delta=False,
+                    debounce=None,
+                    snapshot=False,
                     **kwargs):
         # type: (model_reverser, str, signal_dispatcher,
-        #        bool, bool, **Any) -> None
+        #        bool, bool, bool, float, bool, **Any) -> None
         self.reverse = reverse
         self.sender_field = sender_field
+        self.delta = delta
+        self.debounce = debounce
+        self.snapshot = snapshot
         self.signal_dispatcher = signal_dispatcher
         self._signal_honors_transaction = signal_honors_transaction
         self.propagate_errors = propagate_errors
@@ -317,13 +470,17 @@ class ModelEvent(Event):
         See Also:
             :meth:`Event.send` for more arguments supported.
         """
-        name = self._get_name(instance)
-        return self._send(name, self.to_message(
+        return self._send(*self._message(instance, data, sender),
+                          sender=sender, **kwargs)
+
+    def _message(self, instance, data=None, sender=None):
+        # type: (Model, Any, Any) -> Tuple[str, Dict[str, Any]]
+        return self._get_name(instance), self.to_message(
             data,
             instance=instance,
             sender=sender,
             ref=self.get_absolute_url(instance),
-        ), sender=sender, **kwargs)
+        )
 
     def get_absolute_url(self, instance):
         # type: (Model) -> Optional[str]
@@ -356,6 +513,60 @@ class ModelEvent(Event):
             context=context,
         )
 
+    def prepare_from_instance(self, instance, context={}, memo=None,
+                              **kwargs):
+        # type: (Model, Mapping, Dict, **Any) -> Tuple
+        """Prepare arguments for sending event for ``instance``.
+
+        Returns the ``(event, payload, sender, kwargs)`` tuple taken by
+        :meth:`Dispatcher.send_many <thorn.dispatch.base.Dispatcher.send_many>`.
+        Values that are the same for every event sent for the instance
+        (e.g. the payload) are kept in ``memo``, and only computed once.
+        """
+        sender = self.instance_sender(instance)
+        name, message = self._message(
+            instance, self.instance_data(instance, memo=memo), sender)
+        return self._prepare_send(
+            name, message,
+            headers=self.instance_headers(instance, memo=memo),
+            sender=sender,
+            context=context,
+        )
+
+    def send_debounced(self, instance):
+        # type: (Model) -> Optional[AsyncResult]
+        """Send event for ``instance`` at the end of the debounce window.
+
+        Note:
+            Only the first change within the window schedules a delivery,
+            the delivery will then send the state of the instance at
+            that time.
+        """
+        from .tasks import send_debounced
+        key = self.debounce_key(instance)
+        if self.debounce_cache.add(key, 1, self.debounce + DEBOUNCE_GRACE):
+            return send_debounced.apply_async(
+                (instance._meta.label, instance.pk,
+                 self._event_key(type(instance)), key),
+                countdown=self.debounce,
+            )
+
+    def debounce_key(self, instance):
+        # type: (Model) -> str
+        return 'thorn.debounce.{0}.{1}.{2}'.format(
+            instance._meta.label, instance.pk, self._get_name(instance))
+
+    def _event_key(self, model):
+        # type: (type) -> str
+        # the delivery task finds the event in ``model.webhooks``.
+        return next(
+            k for k, v in items(model.webhooks.events) if v is self)
+
+    @cached_property
+    def debounce_cache(self):
+        # type: () -> Any
+        return self.app.caches[self.app.settings.THORN_DEBOUNCE_CACHE]
+
     def to_message(self, data, instance=None, sender=None, ref=None):
         # type: (Any, Model, Any, str) -> Dict[str, Any]
         name = self._get_name(instance)
@@ -366,15 +577,39 @@ class ModelEvent(Event):
             'data': data or {},
         }
 
-    def instance_data(self, instance):
-        # type: (Model) -> Any
-        """Get event data from ``instance.webhooks.payload()``."""
-        return instance.webhooks.payload(instance)
+    def instance_data(self, instance, memo=None):
+        # type: (Model, Dict) -> Any
+        """Get event data from ``instance.webhooks.payload()``.
 
-    def instance_headers(self, instance):
-        # type: (Model) -> Mapping
+        Note:
+            In delta mode only the changed fields will be sent,
+            see :meth:`instance_delta`.
+        """
+        if self.delta:
+            previous = getattr(instance, '_previous_version', None)
+            if previous is not None:
+                return self.instance_delta(instance, previous)
+        return _memoized(memo, 'payload', instance.webhooks.payload, instance)
+
+    def instance_delta(self, instance, previous):
+        # type: (Model, Model) -> Dict[str, Any]
+        """Get the fields of ``instance`` that differ from ``previous``."""
+        return {
+            'pk': instance.pk,
+            'changed': {
+                attname: value
+                for attname, value in (
+                    (field.attname, getattr(instance, field.attname))
+                    for field in instance._meta.concrete_fields
+                )
+                if value != getattr(previous, attname)
+            },
+        }
+
+    def instance_headers(self, instance, memo=None):
+        # type: (Model, Dict) -> Mapping
         """Get event headers from ``instance.webhooks.headers()``."""
-        return instance.webhooks.headers(instance)
+        return _memoized(memo, 'headers', instance.webhooks.headers, instance)
 
     def instance_sender(self, instance):
         # type: (Model) -> Any
@@ -406,6 +641,8 @@ class ModelEvent(Event):
         # type (Model, Dict) -> promise
         try:
             if self.should_dispatch(instance, **kwargs):
+                if self.debounce:
+                    return self.send_debounced(instance)
                 return self.send_from_instance(instance, **kwargs)
         except Exception as exc:
             if self.propagate_errors:
@@ -456,9 +693,19 @@ class ModelEvent(Event):
     def _prepare_signal_dispatcher(self, signal_dispatcher, *args):
         # type: (type) -> signal_dispatcher
         d = signal_dispatcher(self.on_signal, *args)
-        d.use_transitions = self.use_transitions
+        # delta mode also needs the previous version of the instance.
+        d.use_transitions = self.use_transitions or self.delta
+        d.tracked_fields = None if self.delta else self.transition_fields
+        d.snapshot = self.snapshot
         return d
 
+    @property
+    def transition_fields(self):
+        # type: () -> Optional[Set[str]]
+        """Fields needed from the previous version of the instance."""
+        if self.use_transitions:
+            return self._filter_predicate.transition_fields()
+
     @property
     def signal_dispatcher(self):
         # type: () -> signal_dispatcher
@@ -477,3 +724,80 @@ class ModelEvent(Event):
         if self._signal_honors_transaction is None:
             return self.app.settings.THORN_SIGNAL_HONORS_TRANSACTION
         return self._signal_honors_transaction
+
+
+class ModelEventGroup(object):
+    """Events connected to the same signal of a model.
+
+    Every save of a model instance would otherwise call a signal handler
+    for every event of the model.  The group is connected to the signal
+    using a single handler instead, that evaluates the filters of all
+    the events, builds the payload (and headers) once, and then sends
+    the events dispatched by the same dispatcher together, using
+    :meth:`Dispatcher.send_many <thorn.dispatch.base.Dispatcher.send_many>`
+    to fetch the subscribers of all the events in a single query.
+
+    See Also:
+        :meth:`~thorn.decorators.WebhookCapable.contribute_to_model`.
+    """
+
+    def __init__(self, events):
+        # type: (Sequence[ModelEvent]) -> None
+        self.events = list(events)
+        self.app = self.events[0].app
+        self.signal_dispatcher = self.events[0].signal_dispatcher.combine(
+            [event.signal_dispatcher for event in self.events],
+            self.on_signal,
+        )
+
+    def connect_model(self, model):
+        # type: (Any) -> None
+        for event in self.events:
+            event.models.add(model)
+        self.signal_dispatcher.connect(sender=model)
+
+    def on_signal(self, instance, **kwargs):
+        # type: (Model, **Any) -> Any
+        on_commit = [e for e in self.events if e.signal_honors_transaction]
+        if on_commit:
+            self.app.on_commit(self._on_signal, on_commit, instance, kwargs)
+        now = [e for e in self.events if not e.signal_honors_transaction]
+        if now:
+            return self._on_signal(now, instance, kwargs)
+
+    def _on_signal(self, events, instance, kwargs):
+        # type: (Sequence[ModelEvent], Model, Dict) -> List
+        memo, pending = {}, OrderedDict()
+        for event in events:
+            try:
+                if event.should_dispatch(instance, **kwargs):
+                    if event.debounce:
+                        event.send_debounced(instance)
+                    else:
+                        pending.setdefault(event.dispatcher, []).append((
+                            event, event.prepare_from_instance(
+                                instance, memo=memo, **kwargs)))
+            except Exception as exc:
+                if event.propagate_errors:
+                    raise
+                logger.exception(E_DISPATCH_RAISED_ERROR, event.name, exc)
+        return [
+            self._send_many(dispatcher, sends)
+            for dispatcher, sends in items(pending)
+        ]
+
+    def _send_many(self, dispatcher, sends):
+        # type: (Dispatcher, Sequence[Tuple[ModelEvent, Tuple]]) -> Any
+        try:
+            return dispatcher.send_many([args for _, args in sends])
+        except Exception as exc:
+            if any(event.propagate_errors for event, _ in sends):
+                raise
+            logger.exception(
+                E_DISPATCH_RAISED_ERROR,
+                ', '.join(event.name for event, _ in sends), exc)
+
+    def __repr__(self):
+        # type: () -> str
+        return bytes_if_py2('<{0}: {1}>'.format(
+            type(self).__name__, ', '.join(e.name for e in self.events)))
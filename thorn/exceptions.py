@@ -14,5 +14,67 @@ class SecurityError(ThornError):
     """Security related error."""
 
 
+class ResponseError(ThornError):
+    """Webhook request failed with an unsuccessful HTTP response."""
+
+    def __init__(self, response, *args):
+        # type: (requests.Response, *Any) -> None
+        self.response = response
+        super(ResponseError, self).__init__(
+            'HTTP {0}'.format(response.status_code), *args)
+
+
+class RetryableResponseError(ResponseError):
+    """Webhook request failed, but can be retried later.
+
+    Arguments:
+        response (requests.Response): The HTTP response.
+        retry_after (float): Number of seconds the receiver asked us
+            to wait before retrying (``Retry-After`` header), or
+            :const:`None`.
+    """
+
+    def __init__(self, response, retry_after=None):
+        # type: (requests.Response, float) -> None
+        self.retry_after = retry_after
+        super(RetryableResponseError, self).__init__(response)
+
+
+class CircuitOpen(ThornError):
+    """Request not sent as the circuit breaker for the host is open.
+
+    Arguments:
+        urlident (Tuple): The ``(scheme, port, host)`` of the host.
+        retry_after (float): Number of seconds until a request
+            to the host may be sent again.
+    """
+
+    def __init__(self, urlident, retry_after=None):
+        # type: (Tuple[str, int, str], float) -> None
+        self.urlident = urlident
+        self.retry_after = retry_after
+        super(CircuitOpen, self).__init__(
+            'Circuit open for {0[0]}://{0[2]}:{0[1]}'.format(urlident))
+
+
+class RateLimited(ThornError):
+    """Request not sent as the rate limit for the subscriber is exceeded.
+
+    Arguments:
+        retry_after (float): Number of seconds to wait before
+            sending the request.
+    """
+
+    def __init__(self, retry_after):
+        # type: (float) -> None
+        self.retry_after = retry_after
+        super(RateLimited, self).__init__(
+            'Rate limited: retry in {0:.2f}s'.format(retry_after))
+
+
+class RequestExpired(ThornError):
+    """Request not sent as its delivery deadline has passed."""
+
+
 class BufferNotEmpty(Exception):
     """Trying to close buffer that is not empty."""
@@ -38,6 +38,19 @@ class AbstractSubscriber(object):
     #: MIME-type to use for web requests made to the subscriber :attr:`url`.
     content_type = abstractproperty()
 
+    #: Optional list of dotted paths (e.g. ``["event", "data.title"]``)
+    #: selecting the parts of the event payload sent to this subscriber.
+    #: The full payload is sent when not set.
+    projection = None
+
+    #: Optional rate limit for requests to this subscriber,
+    #: e.g. ``"100/s"`` or ``"600/m"`` (see :mod:`thorn.ratelimit`).
+    rate_limit = None
+
+    #: Maximum number of events delivered together in a single request
+    #: (see :ref:`subscriber-batching`).  Not batched when not set.
+    batch_size = None
+
     @abstractmethod
     def as_dict(self):
         """Dictionary representation of Subscriber."""
@@ -97,6 +110,9 @@ class SubscriberModelMixin(object):
             'hmac_secret': self.hmac_secret,
             'hmac_digest': self.hmac_digest,
             'content_type': self.content_type,
+            'projection': self.projection,
+            'rate_limit': self.rate_limit,
+            'batch_size': self.batch_size,
         }
 
     def sign(self, message):
@@ -13,6 +13,9 @@ class signal_dispatcher(object):
 
     signals = None
 
+    #: Positional arguments (after ``fun``) the dispatcher was created with.
+    args = ()
+
     def __init__(self, fun, use_transitions=False, **kwargs):
         self.fun = fun
         self.use_transitions = use_transitions
@@ -21,6 +24,20 @@ class signal_dispatcher(object):
     def setup_signals(self):
         return {}
 
+    @property
+    def combine_key(self):
+        """Dispatchers having the same key can be combined."""
+        return (type(self),) + tuple(self.args)
+
+    def combine(self, dispatchers, fun):
+        """Return new dispatcher calling ``fun`` for all ``dispatchers``.
+
+        The dispatchers must have the same :attr:`combine_key`.
+        """
+        d = type(self)(fun, *self.args)
+        d.use_transitions = any(x.use_transitions for x in dispatchers)
+        return d
+
     def load_signals(self, signals):
         return {
             symbol_by_name(sig): handler
@@ -0,0 +1,105 @@
+"""Rate limiting requests to subscribers.
+
+Rate limits are enforced by workers using token buckets, and requests
+over the limit are sent later instead of being sent immediately.
+
+Limits can be set per subscriber host using
+the :setting:`THORN_RATE_LIMITS` setting, and per subscriber using
+the :attr:`~thorn.generic.models.AbstractSubscriber.rate_limit` attribute.
+Rates are strings like ``"100/s"``, ``"600/m"`` or ``"1000/h"``,
+the same format used for Celery task rate limits.
+
+Note:
+    The buckets are local to the worker process, so the total rate
+    of requests sent to a host may be up to the number of worker
+    processes times the rate limit.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from celery.utils.functional import LRUCache
+from celery.utils.time import rate
+from kombu.utils.limits import TokenBucket
+from requests.packages.urllib3.util.url import parse_url
+
+from ._state import app_or_default
+
+__all__ = ['RateLimiter']
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter for subscriber requests.
+
+    Keyword Arguments:
+        limits (Mapping[str, str]): Rate limits by subscriber host name.
+            Default is to use the :setting:`THORN_RATE_LIMITS` setting.
+        limit (int): Maximum number of token buckets kept in memory.
+    """
+
+    app = None
+
+    def __init__(self, limits=None, limit=10000, app=None):
+        # type: (Mapping[str, str], int, App) -> None
+        self.app = app_or_default(app or self.app)
+        self.limits = (
+            limits if limits is not None
+            else self.app.settings.THORN_RATE_LIMITS)
+        self._buckets = LRUCache(limit=limit)
+        self._mutex = threading.Lock()
+
+    def acquire(self, subscriber):
+        # type: (Subscriber) -> float
+        """Take a token for sending a request to subscriber.
+
+        Returns:
+            float: zero if the request can be sent now, or otherwise
+                the number of seconds to wait before trying again.
+        """
+        buckets = [
+            self._bucket(key, fill_rate)
+            for key, fill_rate in self.rates_for(subscriber)
+        ]
+        if not buckets:
+            return 0
+        with self._mutex:
+            wait = max(bucket.expected_time(1) for bucket in buckets)
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.can_consume(1)
+            return wait
+
+    def rates_for(self, subscriber):
+        # type: (Subscriber) -> List[Tuple[Tuple, float]]
+        """Return list of ``(bucket_key, tokens_per_second)`` tuples."""
+        rates = []
+        if self.limits:
+            host = parse_url(subscriber.url).host
+            host_rate = rate(self.limits.get(host))
+            if host_rate:
+                rates.append((('host', host), host_rate))
+        # custom subscriber models may not support rate limits.
+        subscriber_rate = rate(getattr(subscriber, 'rate_limit', None))
+        if subscriber_rate:
+            rates.append((
+                ('subscriber', str(subscriber.uuid)), subscriber_rate))
+        return rates
+
+    def _bucket(self, key, fill_rate):
+        # type: (Tuple, float) -> TokenBucket
+        # the rate is part of the key, so a new bucket is used
+        # when the rate limit for a subscriber is changed.
+        key = key + (fill_rate,)
+        with self._mutex:
+            try:
+                return self._buckets[key]
+            except KeyError:
+                # allow bursts of up to one second worth of requests.
+                bucket = self._buckets[key] = TokenBucket(
+                    fill_rate, capacity=max(1.0, fill_rate))
+                return bucket
+
+    def clear(self):
+        # type: () -> None
+        with self._mutex:
+            self._buckets.clear()
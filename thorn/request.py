@@ -1,27 +1,52 @@
 """Webhook HTTP requests."""
 from __future__ import absolute_import, unicode_literals
 
+import random
 import thorn
 import requests
 import socket
+import time
 
 from contextlib import contextmanager
+from email.utils import mktime_tz, parsedate_tz
 
 from celery import uuid
 from celery.utils import cached_property
+from celery.utils.imports import symbol_by_name
 from requests.exceptions import ConnectionError, Timeout
 from requests.packages.urllib3.util.url import Url, parse_url
 from vine import maybe_promise, promise
 from vine.abstract import Thenable, ThenableProxy
 
 from ._state import app_or_default
+from .exceptions import (
+    CircuitOpen, RequestExpired, ResponseError, RetryableResponseError,
+)
 from .utils.compat import bytes_if_py2, restore_from_keys
 from .utils.log import get_logger
 from .validators import (
     block_internal_ips, deserialize_validator, serialize_validator,
 )
 
-__all__ = ['Request']
+__all__ = [
+    'Request', 'classify_response', 'parse_retry_after', 'retry_countdown',
+    'expires_in', 'dead_letter', 'routing_options',
+]
+
+#: Response classification: request succeeded.
+RESPONSE_SUCCESS = 'success'
+
+#: Response classification: request failed, but can be retried.
+RESPONSE_RETRY = 'retry'
+
+#: Response classification: request failed, and retrying will not help.
+RESPONSE_FAIL = 'fail'
+
+#: HTTP status codes (in addition to 5xx) that can be retried.
+RETRY_STATUS_CODES = frozenset([408, 425, 429])
+
+#: HTTP 5xx status codes that should not be retried.
+FAIL_STATUS_CODES = frozenset([501, 505])
 
 F_USER_AGENT = 'Mozilla/5.0 (compatible; thorn/{version}; {requests_UA})'
 
@@ -35,6 +60,109 @@ REQUEST_REPR = '<{0}: {1.event} -> {1.subscriber.url} sender={1.sender!r}>'
 logger = get_logger(__name__)
 
 
+def retry_countdown(retries, delay, backoff=False, backoff_max=None,
+                    jitter=True):
+    # type: (int, float, Union[bool, float], float, bool) -> float
+    """Return number of seconds to wait before retrying a request.
+
+    Arguments:
+        retries (int): Number of times the request has been retried.
+        delay (float): Fixed delay used when ``backoff`` is disabled,
+            and the initial delay when ``backoff`` is :const:`True`.
+        backoff (Union[bool, float]): Enable exponential backoff, using
+            ``backoff`` as the initial delay if a number.
+        backoff_max (float): Maximum delay when using backoff.
+        jitter (bool): Use "full jitter": picking a random delay between
+            zero and the backoff delay, so that requests failing at the
+            same time will not be retried at the same time.
+    """
+    if not backoff:
+        return delay
+    factor = delay if backoff is True else backoff
+    countdown = factor * (2 ** retries)
+    if backoff_max is not None:
+        countdown = min(backoff_max, countdown)
+    if jitter:
+        countdown = random.uniform(0, countdown)
+    return max(0, countdown)
+
+
+def classify_response(response):
+    # type: (requests.Response) -> str
+    """Classify HTTP response as success, retryable or permanent failure.
+
+    This is the default for the :setting:`THORN_RESPONSE_CLASSIFIER`
+    setting:
+
+    - 1xx, 2xx and 3xx responses are successful.
+    - 408 (Request Timeout), 425 (Too Early), 429 (Too Many Requests)
+      and 5xx responses (except 501 and 505) can be retried.
+    - Any other response is a permanent failure.
+    """
+    status = response.status_code
+    if status < 400:
+        return RESPONSE_SUCCESS
+    if status in RETRY_STATUS_CODES or (
+            status >= 500 and status not in FAIL_STATUS_CODES):
+        return RESPONSE_RETRY
+    return RESPONSE_FAIL
+
+
+def parse_retry_after(value, now=None):
+    # type: (str, float) -> Optional[float]
+    """Parse ``Retry-After`` header into number of seconds to wait.
+
+    The value can be either a number of seconds, or an HTTP date.
+    Returns :const:`None` if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        now = now if now is not None else time.time()
+        return max(0.0, mktime_tz(parsed) - now)
+
+
+def expires_in(deadline, app=None, now=None):
+    # type: (Optional[float], App, float) -> Optional[float]
+    """Return seconds until ``deadline``, for the Celery ``expires`` option.
+
+    Returns :const:`None` (no expiry) if there's no deadline, or if a
+    :setting:`THORN_DEAD_LETTER_SINK` is configured: as expired tasks are
+    discarded by Celery, the deadline must be checked by the
+    task for the request to reach the sink.
+    """
+    if deadline is None or app_or_default(app).dead_letter_sink is not None:
+        return None
+    return max(0.0, deadline - (now if now is not None else time.time()))
+
+
+def routing_options(options):
+    # type: (Mapping[str, Any]) -> Dict[str, Any]
+    """Return the Celery routing options (queue, priority) in ``options``.
+
+    Options not set are left out, so that the Celery routing
+    configuration is used instead.
+    """
+    return {
+        key: options[key] for key in ('queue', 'priority')
+        if options.get(key) is not None
+    }
+
+
+def dead_letter(message, app=None):
+    # type: (Dict[str, Any], App) -> None
+    """Pass expired request message to the dead-letter sink (if any)."""
+    logger.info('Webhook request %r expired: not sent', message.get('id'))
+    sink = app_or_default(app).dead_letter_sink
+    if sink is not None:
+        sink(message)
+
+
 @Thenable.register
 class Request(ThenableProxy):
     """Webhook HTTP request.
@@ -66,6 +194,18 @@ class Request(ThenableProxy):
             Default is 3.
         retry_delay (float): Delay between retries in seconds int/float.
             Default is 60 seconds.
+        retry_backoff (Union[bool, float]): Use exponential backoff
+            for retries, see :func:`retry_countdown`.
+        retry_backoff_max (float): Maximum delay in seconds between retries
+            when using exponential backoff.
+        retry_jitter (bool): Randomize the exponential backoff delay.
+        deadline (float): Timestamp after which the request is
+            no longer sent (see :attr:`expired`).
+        queue (str): Celery queue for tasks sending this request.
+        priority (int): Celery message priority for tasks sending
+            this request.
+        batch (int): Number of events in a batched request,
+            sent in the ``Hook-Batch`` header.
     """
 
     app = None
@@ -81,6 +221,13 @@ class Request(ThenableProxy):
     #: Tuple of exceptions considered a timeout error.
     timeout_errors = (Timeout,)
 
+    #: Tuple of exceptions considered a response error that can be retried.
+    retryable_response_errors = (RetryableResponseError,)
+
+    #: Tuple of exceptions raised when the circuit breaker
+    #: for the host is open.
+    circuit_errors = (CircuitOpen,)
+
     #: HTTP User-Agent header.
     user_agent = DEFAULT_USER_AGENT
 
@@ -91,11 +238,15 @@ class Request(ThenableProxy):
                  headers=None, user_agent=None, app=None,
                  recipient_validators=None,
                  allow_keepalive=True,
-                 allow_redirects=None):
+                 allow_redirects=None,
+                 retry_backoff=None, retry_backoff_max=None,
+                 retry_jitter=None, deadline=None,
+                 queue=None, priority=None, batch=None):
         # type: (str, Dict, Any, Subscriber, str, Callable,
         #        Callable, float, Callable, bool, int,
         #        float, Mapping, str, App, Sequence[Callable],
-        #        bool, bool) -> None
+        #        bool, bool, Union[bool, float], float, bool,
+        #        float, str, int, int) -> None
         self.app = app_or_default(app or self.app)
         self.id = id or uuid()
         self.event = event
@@ -113,6 +264,19 @@ class Request(ThenableProxy):
         self.retry_delay = (
             self.app.settings.THORN_RETRY_DELAY
             if retry_delay is None else retry_delay)
+        self.retry_backoff = (
+            self.app.settings.THORN_RETRY_BACKOFF
+            if retry_backoff is None else retry_backoff)
+        self.retry_backoff_max = (
+            self.app.settings.THORN_RETRY_BACKOFF_MAX
+            if retry_backoff_max is None else retry_backoff_max)
+        self.retry_jitter = (
+            self.app.settings.THORN_RETRY_JITTER
+            if retry_jitter is None else retry_jitter)
+        self.deadline = deadline
+        self.queue = queue
+        self.priority = priority
+        self.batch = batch
         if recipient_validators is None:
             recipient_validators = self.app.settings.THORN_RECIPIENT_VALIDATORS
         self.allow_keepalive = allow_keepalive
@@ -133,17 +297,65 @@ class Request(ThenableProxy):
         [validate(url) for validate in self.recipient_validators]
 
     def sign_request(self, subscriber, data):
-        # type: (Subscriber, str) -> str
+        # type: (Subscriber, Union[str, bytes]) -> str
         return subscriber.sign(data)
 
+    def retry_countdown(self, retries):
+        # type: (int) -> float
+        """Return delay in seconds before retrying this request."""
+        return retry_countdown(
+            retries, self.retry_delay,
+            backoff=self.retry_backoff,
+            backoff_max=self.retry_backoff_max,
+            jitter=self.retry_jitter,
+        )
+
     def dispatch(self, session=None, propagate=False):
         # type: (requests.Session, bool) -> 'Request'
         if not self.cancelled:
+            if self.expired:
+                return self.handle_expired()
             self.validate_recipient(self.subscriber.url)
             with self._finalize_unless_request_error(propagate):
-                self.response = self.post(session=session)
+                with self._circuit_breaker():
+                    self.response = self.post(session=session)
+                    self.check_response(self.response)
             return self
 
+    @contextmanager
+    def _circuit_breaker(self):
+        # type: () -> Any
+        breaker = self.app.circuit_breaker
+        if not breaker.enabled:
+            yield
+            return
+        urlident = self.urlident
+        breaker.before_request(urlident)
+        try:
+            yield
+        except (self.connection_errors + self.timeout_errors +
+                self.retryable_response_errors):
+            breaker.on_failure(urlident)
+            raise
+        except ResponseError:
+            # the host is up, the request was rejected.
+            breaker.on_success(urlident)
+            raise
+        else:
+            breaker.on_success(urlident)
+
+    def check_response(self, response):
+        # type: (requests.Response) -> None
+        """Raise :exc:`~thorn.exceptions.ResponseError` if unsuccessful."""
+        status = self.response_classifier(response)
+        if status == RESPONSE_RETRY:
+            raise RetryableResponseError(
+                response, retry_after=parse_retry_after(
+                    response.headers.get('Retry-After')),
+            )
+        elif status != RESPONSE_SUCCESS:
+            raise ResponseError(response)
+
     @contextmanager
     def _finalize_unless_request_error(self, propagate=False):
         # type: (bool) -> Any
@@ -153,6 +365,10 @@ class Request(ThenableProxy):
             self.handle_timeout_error(exc, propagate=propagate)
         except self.connection_errors as exc:
             self.handle_connection_error(exc, propagate=propagate)
+        except ResponseError as exc:
+            self.handle_response_error(exc, propagate=propagate)
+        except self.circuit_errors as exc:
+            self.handle_circuit_open(exc, propagate=propagate)
         else:
             self._p()
 
@@ -225,6 +441,48 @@ class Request(ThenableProxy):
                      exc, exc_info=1, extra={'data': self.as_dict()})
         self._p.throw(exc, propagate=propagate)
 
+    def handle_response_error(self, exc, propagate=False):
+        # type: (ResponseError, bool) -> None
+        logger.error('Webhook request failed with response: %r',
+                     exc, extra={'data': self.as_dict()})
+        # there's no point in retrying permanent errors.
+        self._p.throw(exc, propagate=(
+            propagate and isinstance(exc, self.retryable_response_errors)))
+
+    def handle_expired(self):
+        # type: () -> 'Request'
+        dead_letter(self.as_dict(), app=self.app)
+        self._p.throw(RequestExpired(
+            'Request {0!r} expired'.format(self.id)), propagate=False)
+        return self
+
+    def expires_before(self, countdown, now=None):
+        # type: (float, float) -> bool
+        """Return true if deadline passes within ``countdown`` seconds."""
+        return self.deadline is not None and (
+            (now if now is not None else time.time()) + countdown >=
+            self.deadline)
+
+    @property
+    def expired(self):
+        # type: () -> bool
+        """True if the deadline for delivering this request has passed."""
+        return self.expires_before(0)
+
+    @property
+    def routing(self):
+        # type: () -> Dict[str, Any]
+        """Celery routing options for tasks sending this request."""
+        return routing_options({
+            'queue': self.queue, 'priority': self.priority,
+        })
+
+    def handle_circuit_open(self, exc, propagate=False):
+        # type: (CircuitOpen, bool) -> None
+        logger.info('Webhook request not sent: %r', exc,
+                    extra={'data': self.as_dict()})
+        self._p.throw(exc, propagate=propagate)
+
     def as_dict(self):
         # type: () -> Dict[str, Any]
         """Return dictionary representation of this request.
@@ -242,6 +500,13 @@ class Request(ThenableProxy):
             'retry': self.retry,
             'retry_max': self.retry_max,
             'retry_delay': self.retry_delay,
+            'retry_backoff': self.retry_backoff,
+            'retry_backoff_max': self.retry_backoff_max,
+            'retry_jitter': self.retry_jitter,
+            'deadline': self.deadline,
+            'queue': self.queue,
+            'priority': self.priority,
+            'batch': self.batch,
             'recipient_validators': self._serialize_validators(
                 self._recipient_validators,
             ),
@@ -285,12 +550,15 @@ class Request(ThenableProxy):
     @property
     def default_headers(self):
         # type: () -> Dict[str, Any]
-        return {
+        headers = {
             'Content-Type': self.subscriber.content_type,
             'User-Agent': self.user_agent,
             'Hook-Event': self.event,
             'Hook-Delivery': self.id,
         }
+        if self.batch:
+            headers['Hook-Batch'] = str(self.batch)
+        return headers
 
     @cached_property
     def urlident(self):
@@ -299,6 +567,11 @@ class Request(ThenableProxy):
         url = parse_url(self.subscriber.url)
         return url.scheme or 'http', url.port or 80, url.host
 
+    @cached_property
+    def response_classifier(self):
+        # type: () -> Callable[[requests.Response], str]
+        return symbol_by_name(self.app.settings.THORN_RESPONSE_CLASSIFIER)
+
     @property
     def value(self):
         # type: () -> Optional[requests.Response]
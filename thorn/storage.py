@@ -0,0 +1,197 @@
+"""Offloading large payloads out of task messages.
+
+Payloads larger than :setting:`THORN_PAYLOAD_STORE_THRESHOLD` are written
+to a blob store, and the task message will only carry a reference to it
+(this is also known as the *claim-check* pattern).
+"""
+from __future__ import absolute_import, unicode_literals
+
+import io
+import os
+import tempfile
+import time
+
+from six import text_type
+
+from celery import uuid
+from celery.utils.functional import LRUCache
+from celery.utils.imports import symbol_by_name
+
+from ._state import app_or_default
+from .utils import json
+
+__all__ = ['BlobStore', 'MemoryStore', 'FileSystemStore', 'ClaimCheck']
+
+#: Key used to mark a value as a reference to a stored blob.
+REF_KEY = '__thorn_ref__'
+
+
+class BlobStore(object):
+    """Blob store interface.
+
+    Stored values are text, e.g. the json serialized payload.
+    """
+
+    def put(self, key, value):
+        # type: (str, str) -> None
+        raise NotImplementedError('subclass responsibility')
+
+    def get(self, key):
+        # type: (str) -> str
+        raise NotImplementedError('subclass responsibility')
+
+    def delete(self, key):
+        # type: (str) -> None
+        raise NotImplementedError('subclass responsibility')
+
+
+class MemoryStore(BlobStore):
+    """In-memory blob store.
+
+    Note:
+        Only usable when the tasks are executed by the same
+        process, e.g. in tests or with ``task_always_eager`` enabled.
+    """
+
+    def __init__(self, limit=1000):
+        # type: (int) -> None
+        self.data = LRUCache(limit=limit)
+
+    def put(self, key, value):
+        # type: (str, str) -> None
+        self.data[key] = value
+
+    def get(self, key):
+        # type: (str) -> str
+        return self.data[key]
+
+    def delete(self, key):
+        # type: (str) -> None
+        self.data.pop(key, None)
+
+
+class FileSystemStore(BlobStore):
+    """Blob store keeping blobs as files in a directory.
+
+    The directory must be shared by all web servers and workers,
+    (e.g. using NFS), and stale files must be removed regularly,
+    see :meth:`cleanup`.
+    """
+
+    def __init__(self, path=None):
+        # type: (str) -> None
+        self.path = path or os.path.join(
+            tempfile.gettempdir(), 'thorn-payloads')
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:  # pragma: no cover
+                if not os.path.isdir(self.path):  # created by other process
+                    raise
+
+    def put(self, key, value):
+        # type: (str, str) -> None
+        # write to temporary file first, so that readers
+        # will never see a partially written blob.
+        tmp = self._path_for(key) + '.tmp'
+        with io.open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(value)
+        os.rename(tmp, self._path_for(key))
+
+    def get(self, key):
+        # type: (str) -> str
+        with io.open(self._path_for(key), 'r', encoding='utf-8') as fh:
+            return fh.read()
+
+    def delete(self, key):
+        # type: (str) -> None
+        try:
+            os.unlink(self._path_for(key))
+        except OSError:
+            pass
+
+    def cleanup(self, max_age, now=None):
+        # type: (float, float) -> None
+        """Remove blobs older than ``max_age`` seconds."""
+        now = now if now is not None else time.time()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.unlink(path)
+            except OSError:  # pragma: no cover
+                pass
+
+    def _path_for(self, key):
+        # type: (str) -> str
+        return os.path.join(self.path, os.path.basename(key))
+
+
+class ClaimCheck(object):
+    """Store large values in a blob store, and resolve references to them.
+
+    Resolved values are cached by the process, so that a worker
+    will only fetch a blob once while delivering its request batches.
+    """
+
+    app = None
+
+    #: Blob store aliases that can be used in
+    #: the :setting:`THORN_PAYLOAD_STORE` setting.
+    stores = {
+        'memory': 'thorn.storage:MemoryStore',
+        'filesystem': 'thorn.storage:FileSystemStore',
+    }
+
+    def __init__(self, store=None, threshold=None, cache_limit=32, app=None):
+        # type: (Union[str, BlobStore], int, int, App) -> None
+        self.app = app_or_default(app or self.app)
+        store = (store if store is not None
+                 else self.app.settings.THORN_PAYLOAD_STORE)
+        if store is not None and not isinstance(store, BlobStore):
+            store = symbol_by_name(store, self.stores)()
+        self.store = store
+        self.threshold = (
+            threshold if threshold is not None
+            else self.app.settings.THORN_PAYLOAD_STORE_THRESHOLD)
+        self._cache = LRUCache(limit=cache_limit)
+
+    def offload_payload(self, payload):
+        # type: (Any) -> Any
+        """Offload event payload if its serialized size is too large."""
+        if self.store is None:
+            return payload
+        return self._offload(json.dumps(payload), payload, json=True)
+
+    def offload_body(self, body):
+        # type: (Any) -> Any
+        """Offload encoded request body if it's too large."""
+        if self.store is None or not isinstance(body, text_type):
+            return body
+        return self._offload(body, body)
+
+    def _offload(self, value, original, **options):
+        # type: (str, Any, **Any) -> Any
+        if len(value) <= self.threshold:
+            return original
+        key = uuid()
+        self.store.put(key, value)
+        return dict(options, **{REF_KEY: key})
+
+    def resolve(self, value):
+        # type: (Any) -> Any
+        """Return the value referenced, or ``value`` if not a reference."""
+        if not is_ref(value):
+            return value
+        key = value[REF_KEY]
+        try:
+            blob = self._cache[key]
+        except KeyError:
+            blob = self._cache[key] = self.store.get(key)
+        return json.loads(blob) if value.get('json') else blob
+
+
+def is_ref(value):
+    # type: (Any) -> bool
+    """Return true if value is a reference to a stored blob."""
+    return isinstance(value, dict) and REF_KEY in value
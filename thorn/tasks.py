@@ -1,12 +1,34 @@
 """Tasks used by the Celery dispatcher."""
 from __future__ import absolute_import, unicode_literals
 
+import time
+
+from six import iteritems as items, text_type
+
 from celery import shared_task
 from celery.utils.functional import memoize
 
 from ._state import app_or_default
+from .dispatch.wire import expand_requests, is_compact, is_subscriber_ref
+from .exceptions import RateLimited
+from .generic.models import AbstractSubscriber
+from .request import (
+    dead_letter, expires_in, retry_countdown, routing_options,
+)
+from .utils.compat import want_bytes
+from .utils.log import get_logger
+
+__all__ = [
+    'send_event', 'send_events', 'send_debounced', 'dispatch_requests', 'dispatch_request',
+]
 
-__all__ = ['send_event', 'dispatch_requests', 'dispatch_request']
+E_SUBSCRIBER_MISSING = 'Subscriber %r no longer exists: skipping request %r'
+E_REQUEST_FAILED = 'Request %r failed: %r (retry in %.2fs)'
+E_REQUEST_GAVE_UP = 'Request %r failed: %r (giving up)'
+E_REQUEST_RATE_LIMITED = 'Request %r rate limited (send in %.2fs)'
+E_INSTANCE_MISSING = '%s %r no longer exists: skipping debounced event %r'
+
+logger = get_logger(__name__)
 
 
 @memoize()
@@ -25,34 +47,206 @@ def send_event(event, payload, sender, timeout, context={}, **kwargs):
         This will use the WorkerDispatcher to dispatch the individual
         HTTP requests in batches (``dispatch_requests -> dispatch_request``).
     """
-    _worker_dispatcher().send(
-        event, payload, sender, timeout=timeout, context=context, **kwargs)
+    dispatcher = _worker_dispatcher()
+    dispatcher.send(
+        event, dispatcher.app.claim_check.resolve(payload), sender,
+        timeout=timeout, context=context, **kwargs)
+
+
+@shared_task(ignore_result=True)
+def send_events(events):
+    # type: (Sequence[Dict]) -> None
+    """Task sending multiple events (see ``Dispatcher.send_many``).
+
+    Note:
+        The subscribers of events having the same sender are fetched
+        using a single query.
+    """
+    dispatcher = _worker_dispatcher()
+    resolve = dispatcher.app.claim_check.resolve
+    dispatcher.send_many([
+        (message['event'], resolve(message['payload']), message['sender'],
+         {k: v for k, v in items(message)
+          if k not in ('event', 'payload', 'sender')})
+        for message in events
+    ])
+
+
+@shared_task(ignore_result=True)
+def send_debounced(model_label, pk, event_key, key, app=None):
+    # type: (str, Any, str, str, App) -> None
+    """Send debounced model event using the latest state of the instance.
+
+    See Also:
+        The ``debounce`` argument to :class:`~thorn.events.ModelEvent`.
+    """
+    app = app_or_default(app)
+    model = app.get_model(model_label)
+    event = model.webhooks.events[event_key]
+    # changes made from now on will schedule a new delivery.
+    event.debounce_cache.delete(key)
+    try:
+        instance = model._default_manager.get(pk=pk)
+    except model.DoesNotExist:
+        return logger.info(E_INSTANCE_MISSING, model_label, pk, event.name)
+    # the filter may no longer match the latest state (transition
+    # filters cannot be checked, as we don't know the previous state).
+    if event.use_transitions or event.should_dispatch(instance):
+        event.send_from_instance(instance)
 
 
 @shared_task(ignore_result=True)
 def dispatch_requests(reqs, app=None):
-    # type: (Sequence[Dict], App) -> None
-    """Process a batch of HTTP requests."""
+    # type: (Union[Dict, Sequence[Dict]], App) -> None
+    """Process a batch of HTTP requests.
+
+    Note:
+        The batch is either in the compact format
+        (see :mod:`thorn.dispatch.wire`), or a list of request dictionaries.
+
+    Note:
+        A request failing with a connection error, timeout,
+        a response that can be retried (e.g. HTTP 503), or not sent
+        because the circuit breaker for the host is open, is retried
+        by itself in a new :func:`dispatch_request` task, so that retrying
+        never sends the other requests in the batch again.
+    """
     app = app_or_default(app)
+    if is_compact(reqs):
+        reqs = expand_requests(reqs)
+    # resolve all subscribers referenced by uuid using a single query.
+    refs = {
+        r['subscriber'] for r in reqs if is_subscriber_ref(r['subscriber'])
+    }
+    subscribers = app.subscriber_cache.get_many(refs) if refs else {}
     session = app.Request.Session()
-    [dispatch_request(session=session, app=app, **req) for req in reqs]
+    retry_errors = _retry_errors(app.Request)
+    bodies = {}
+    for req in reqs:
+        subscriber = req['subscriber']
+        if is_subscriber_ref(subscriber):
+            try:
+                subscriber = subscribers[subscriber]
+            except KeyError:
+                logger.info(E_SUBSCRIBER_MISSING, subscriber, req['id'])
+                continue
+        try:
+            dispatch_request(
+                session=session, app=app, bodies=bodies,
+                **dict(req, subscriber=subscriber))
+        except RateLimited as exc:
+            _defer_request(app, req, exc.retry_after)
+        except retry_errors as exc:
+            _retry_request(app, req, exc)
+
+
+def _defer_request(app, req, countdown, retries=0):
+    # type: (App, Dict, float, int) -> None
+    # over the rate limit: send later, this does not count as a retry.
+    logger.debug(E_REQUEST_RATE_LIMITED, req.get('id'), countdown)
+    _reschedule(app, req, countdown, retries)
+
+
+def _reschedule(app, req, countdown, retries):
+    # type: (App, Dict, float, int) -> None
+    deadline = req.get('deadline')
+    if deadline is not None and time.time() + countdown >= deadline:
+        # the request would expire before being sent.
+        return dead_letter(req, app=app)
+    dispatch_request.apply_async(
+        kwargs=req, countdown=countdown, retries=retries,
+        expires=expires_in(deadline, app=app), **routing_options(req))
+
+
+def _retry_errors(request):
+    # type: (Request) -> Tuple[type, ...]
+    return (request.connection_errors + request.timeout_errors +
+            request.retryable_response_errors + request.circuit_errors)
+
+
+def _retry_after(exc):
+    # type: (Exception) -> Optional[float]
+    # the receiver may tell us when to retry (``Retry-After``),
+    # and an open circuit when the next request is allowed.
+    return getattr(exc, 'retry_after', None)
+
+
+def _retry_request(app, req, exc):
+    # type: (App, Dict, Exception) -> None
+    # reschedules the original request message, so the payload/subscriber
+    # references are resolved again by the worker executing the retry.
+    settings = app.settings
+    retry_max = req.get('retry_max', settings.THORN_RETRY_MAX)
+    if retry_max is not None and retry_max < 1:
+        return logger.error(E_REQUEST_GAVE_UP, req.get('id'), exc)
+    countdown = _retry_after(exc)
+    if countdown is None:
+        countdown = retry_countdown(
+            0, req.get('retry_delay', settings.THORN_RETRY_DELAY),
+            backoff=req.get('retry_backoff', settings.THORN_RETRY_BACKOFF),
+            backoff_max=req.get(
+                'retry_backoff_max', settings.THORN_RETRY_BACKOFF_MAX),
+            jitter=req.get('retry_jitter', settings.THORN_RETRY_JITTER),
+        )
+    logger.info(E_REQUEST_FAILED, req.get('id'), exc, countdown)
+    _reschedule(app, req, countdown, 1)
+
+
+def _shared_body(data, bodies):
+    # type: (Any, Dict[str, bytes]) -> Any
+    # Requests in a batch usually have the same body, so we only
+    # convert every distinct body to bytes once.
+    if isinstance(data, text_type):
+        try:
+            return bodies[data]
+        except KeyError:
+            body = bodies[data] = want_bytes(data)
+            return body
+    return data
 
 
 @shared_task(bind=True, ignore_result=True)
 def dispatch_request(self, event, data, sender, subscriber,
-                     session=None, app=None, **kwargs):
-    # type: (str, Dict, Any, Dict, requests.Session, App, **Any) -> None
-    """Process a single HTTP request."""
+                     session=None, app=None, bodies=None, **kwargs):
+    # type: (str, Dict, Any, Dict, requests.Session, App,
+    #        Dict[str, bytes], **Any) -> None
+    """Process a single HTTP request.
+
+    Raises:
+        ~thorn.exceptions.RateLimited: if the rate limit for the subscriber
+            is exceeded when called directly (e.g. by
+            :func:`dispatch_requests`).  When executed as a task the request
+            is sent later instead.
+    """
     app = app_or_default(app)
-    # the user is serialized as the pk, so we cannot pass it
-    # directly to Subscriber, but we also don't need it at this point.
-    subscriber.pop('user', None)
-    subscriber = app.Subscriber(**subscriber)
+    data = _shared_body(
+        app.claim_check.resolve(data), bodies if bodies is not None else {})
+    if is_subscriber_ref(subscriber):
+        ref, subscriber = subscriber, app.subscriber_cache.get(subscriber)
+        if subscriber is None:
+            return logger.info(E_SUBSCRIBER_MISSING, ref, kwargs.get('id'))
+    elif not isinstance(subscriber, AbstractSubscriber):
+        # the user is serialized as the pk, so we cannot pass it
+        # directly to Subscriber, but we also don't need it at this point.
+        subscriber.pop('user', None)
+        subscriber = app.Subscriber(**subscriber)
+    delay = app.rate_limiter.acquire(subscriber)
+    if delay:
+        if self.request.called_directly:
+            raise RateLimited(delay)
+        return _defer_request(
+            app, self.request.kwargs, delay, retries=self.request.retries)
     request = app.Request(event, data, sender, subscriber, **kwargs)
     try:
         request.dispatch(session=session, propagate=request.retry)
-    except request.connection_errors + request.timeout_errors as exc:
+    except _retry_errors(request) as exc:
         if request.retry:
-            raise self.retry(exc=exc, max_retries=request.retry_max,
-                             countdown=request.retry_delay)
+            countdown = _retry_after(exc)
+            if countdown is None:
+                countdown = request.retry_countdown(self.request.retries)
+            if request.expires_before(countdown):
+                return request.handle_expired()
+            raise self.retry(
+                exc=exc, max_retries=request.retry_max, countdown=countdown,
+                expires=expires_in(request.deadline, app=app))
         raise
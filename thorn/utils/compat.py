@@ -2,8 +2,14 @@
 from __future__ import absolute_import, unicode_literals
 
 import sys
+import threading
 
-__all__ = ['bytes_if_py2']
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    ContextVar = None  # noqa
+
+__all__ = ['bytes_if_py2', 'ContextVar']
 
 PY3 = sys.version_info[0] >= 3
 
@@ -31,3 +37,28 @@ else:  # pragma: no cover
 def restore_from_keys(fun, args, kwargs):
     """Pickle helper to support kwargs in ``__reduce__``."""
     return fun(*args, **kwargs)
+
+
+class _ThreadLocalVar(object):
+    """Fallback for :class:`contextvars.ContextVar` on Python < 3.7.
+
+    Without :mod:`contextvars` the value will be local to the current
+    thread (so not to e.g. :mod:`asyncio` tasks running in the same thread).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._local = threading.local()
+
+    def get(self):
+        try:
+            return self._local.value
+        except AttributeError:
+            raise LookupError(self.name)
+
+    def set(self, value):
+        self._local.value = value
+
+
+if ContextVar is None:  # pragma: no cover
+    ContextVar = _ThreadLocalVar  # noqa
@@ -3,7 +3,7 @@ from __future__ import absolute_import, unicode_literals
 
 import operator
 
-from collections import Callable, deque
+from collections import Callable, Mapping, deque
 from functools import partial
 from itertools import islice
 from six import string_types
@@ -17,7 +17,10 @@ try:
 except ImportError:  # pragma: no cover
     from .django.query_utils import Q as _Q_  # noqa
 
-__all__ = ['chunks', 'Q']
+__all__ = [
+    'chunks', 'event_patterns', 'interleave', 'parse_projection', 'project',
+    'Q',
+]
 
 E_FILTER_FIELD_MISSING_OP = (
     "filter field argument {0!r} not allowed: did you mean '{0}__eq'?"
@@ -101,6 +104,20 @@ def wrap_transition(op, did_change):
     return compare
 
 
+def _transition_fields(node):
+    # works for both our Q and Django Q objects, as nodes are only
+    # converted when the tree is evaluated.
+    fields = set()
+    for child in node.children:
+        if isinstance(child, _Q_):
+            fields |= _transition_fields(child)
+        else:
+            path, _, opcode = child[0].rpartition('__')
+            if opcode.startswith('now_'):
+                fields.add(path.split('__')[0])
+    return fields
+
+
 def chunks(it, n):
     """Split an iterator into chunks with `n` elements each.
 
@@ -119,6 +136,87 @@ def chunks(it, n):
         yield [first] + list(islice(it, n - 1))
 
 
+def interleave(iterables, weights=None):
+    """Interleave items from iterables using weighted round-robin.
+
+    Every round takes up to ``weight`` items from each iterable,
+    until all of them are exhausted.
+
+    Example:
+        >>> list(interleave([[1, 2, 3, 4], ['a', 'b'], ['x']], [2, 1, 1]))
+        [1, 2, 'a', 'x', 3, 4, 'b']
+    """
+    weights = weights if weights is not None else [1] * len(iterables)
+    lanes = deque(
+        (iter(it), max(1, weight)) for it, weight in zip(iterables, weights)
+    )
+    while lanes:
+        it, weight = lanes.popleft()
+        taken = list(islice(it, weight))
+        for item in taken:
+            yield item
+        if len(taken) == weight:
+            lanes.append((it, weight))
+
+
+def event_patterns(name):
+    """Return the subscription patterns matching event name.
+
+    Example:
+        >>> event_patterns('order.created')
+        ('order.created', 'order.*', '*.created', '*')
+    """
+    topic, _, rest = name.partition('.')
+    return (name, topic + '.*', '*.' + rest, '*')
+
+
+def parse_projection(value):
+    """Normalize subscriber field projection.
+
+    The projection can be given as a list of dotted paths, or as a
+    string of paths separated by comma and/or whitespace.
+
+    Returns:
+        Optional[Tuple[str]]: Sorted tuple of unique paths,
+            or :const:`None` if the projection is empty.
+
+    Example:
+        >>> parse_projection('data.title, event')
+        ('data.title', 'event')
+    """
+    if not value:
+        return None
+    if isinstance(value, string_types):
+        value = value.replace(',', ' ').split()
+    return tuple(sorted(set(value))) or None
+
+
+def project(data, paths):
+    """Return copy of mapping only containing the given dotted paths.
+
+    Paths that are missing from ``data``, or that traverse into a value
+    that is not a mapping, are silently skipped.
+
+    Example:
+        >>> project({'a': {'b': 1, 'c': 2}, 'd': 3}, ['a.b', 'd'])
+        {'a': {'b': 1}, 'd': 3}
+    """
+    result = {}
+    for path in paths:
+        keys = path.split('.')
+        value = data
+        for key in keys:
+            if not isinstance(value, Mapping) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = result
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return result
+
+
 class Q(_Q_):
     """Object query node.
 
@@ -291,6 +389,14 @@ class Q(_Q_):
         else:
             return getter(prev)
 
+    def transition_fields(self):
+        """Return the names of the fields used by transition operators.
+
+        Only the first part of a path is included, i.e. ``"author"``
+        for ``author__name__now_eq``.
+        """
+        return _transition_fields(self)
+
     @property
     def gate(self):
         return self.gates[self.connector]
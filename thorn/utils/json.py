@@ -15,7 +15,7 @@ except ImportError:  # pragma: no cover
     class DjangoPromise(object):  # noqa
         pass
 
-__all__ = ['JsonEncoder', 'dumps']
+__all__ = ['JsonEncoder', 'dumps', 'loads']
 
 _JSON_EXTRA_ARGS = {
     'simplejson': {'use_decimal': False},
@@ -69,3 +69,8 @@ class JsonEncoder(get_best_json('JSONEncoder')[0]):
 def dumps(obj, encode=json.dumps, cls=JsonEncoder):
     """Serialize object as json string."""
     return encode(obj, cls=cls, **_json_args)
+
+
+def loads(s, decode=json.loads):
+    """Deserialize json string."""
+    return decode(s)